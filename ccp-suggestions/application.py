@@ -1,9 +1,11 @@
 from dotenv import load_dotenv
 from flask import Flask
-from sys import argv
+from signal import signal, SIGTERM
+from sys import argv, exit
 from waitress import serve
 
 from flask_config.blueprints import blueprint
+from src.commands.common.model_registry import get_model
 
 load_dotenv('.env')
 
@@ -11,6 +13,12 @@ app = Flask(__name__)
 app.register_blueprint(blueprint)
 
 if __name__ == "__main__":
+    # Load and warm up the active model before accepting traffic
+    get_model()
+
+    # Exit normally on SIGTERM so atexit handlers flush pending Pub/Sub batches
+    signal(SIGTERM, lambda signum, frame: exit(0))
+
     if argv[1] == "dev":
         app.run(host="0.0.0.0", port=3000, debug=True)
 
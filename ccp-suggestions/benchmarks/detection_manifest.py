@@ -0,0 +1,56 @@
+"""
+Compares the per-frame JSON metadata against the binary detection manifest: payload size and the
+time to turn the payload back into BoxSets.
+
+Run from the service root:
+    python -m benchmarks.detection_manifest --frames 5 --boxes 50 150 400
+"""
+import argparse
+import json
+from time import perf_counter
+
+from benchmarks.overlap_areas import shelf_boxes
+from src.commands.common.boxes import BoxSet
+from src.commands.common.manifest import build_manifest, load_manifest
+
+
+def timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=5)
+    parser.add_argument("--boxes", type=int, nargs="+", default=[50, 150, 400])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for count in args.boxes:
+        records = [shelf_boxes(count, seed) for seed in range(args.frames)]
+        payloads = [json.dumps(frame).encode("utf-8") for frame in records]
+        manifest = build_manifest(
+            [(f"frame_{index}.jpg", BoxSet.from_records(frame)) for index, frame in enumerate(records)], {0: "retail"}
+        )
+
+        for frame, loaded in zip(records, load_manifest(manifest)):
+            assert loaded["boxes"].x1.tolist() == [box["x1"] for box in frame]
+            assert loaded["boxes"].y2.tolist() == [box["y2"] for box in frame]
+
+        json_time = timed(lambda: [BoxSet.from_records(json.loads(payload)) for payload in payloads], args.repeat)
+        manifest_time = timed(lambda: load_manifest(manifest), args.repeat)
+        json_size = sum(len(payload) for payload in payloads)
+
+        print(
+            f"{count:4d} boxes x {args.frames} frames  "
+            f"json {json_size / 1024:8.1f} KiB {json_time * 1000:7.2f} ms  "
+            f"manifest {len(manifest) / 1024:7.1f} KiB {manifest_time * 1000:7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
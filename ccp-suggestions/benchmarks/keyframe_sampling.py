@@ -0,0 +1,96 @@
+"""
+Compares the old seek-per-sample loop of predict_keyframes against the forward decoding sampler.
+
+Run from the service root:
+    python -m benchmarks.keyframe_sampling path/to/video.mp4 [more videos] --frames 10 --repeat 3
+    python -m benchmarks.keyframe_sampling --synthetic 120
+"""
+import argparse
+import cv2
+import numpy as np
+import os
+import tempfile
+from time import perf_counter
+
+from src.commands.common.video import read_frames, sample_indices, scan_key_frames, snap_to_key_frames
+
+
+def seek_sampling(video_path, num_frames):
+    capture = cv2.VideoCapture(video_path)
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    step = max(1, total_frames // num_frames)
+
+    frames = []
+    current = 0
+    while len(frames) < num_frames:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, current)
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+        current += step
+
+    capture.release()
+    return frames
+
+
+def sequential_sampling(video_path, num_frames, snap=False):
+    capture = cv2.VideoCapture(video_path)
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    indices = sample_indices(total_frames, num_frames)
+    key_frames = None
+    if snap:
+        key_frames = scan_key_frames(video_path)
+        indices = snap_to_key_frames(indices, key_frames)
+
+    frames = [frame for _, frame in read_frames(capture, indices, key_frames)]
+    capture.release()
+    return frames
+
+
+def write_synthetic_video(seconds, fps=30, size=(1280, 720)):
+    path = os.path.join(tempfile.mkdtemp(), "synthetic.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+    for index in range(seconds * fps):
+        writer.write(np.roll(background, index * 4, axis=1))
+    writer.release()
+    return path
+
+
+def timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        frames = function()
+        best = min(best, perf_counter() - start)
+    return best, len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("videos", nargs="*")
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, default=0, help="seconds of synthetic 720p video to add")
+    args = parser.parse_args()
+
+    videos = list(args.videos)
+    if args.synthetic:
+        videos.append(write_synthetic_video(args.synthetic))
+
+    for video in videos:
+        print(video)
+        runs = {
+            "seek": lambda: seek_sampling(video, args.frames),
+            "sequential": lambda: sequential_sampling(video, args.frames),
+            "sequential+snap": lambda: sequential_sampling(video, args.frames, snap=True),
+        }
+        for name, function in runs.items():
+            elapsed, count = timed(function, args.repeat)
+            print(f"  {name:<16} {elapsed * 1000:9.1f} ms  ({count} frames)")
+
+
+if __name__ == "__main__":
+    main()
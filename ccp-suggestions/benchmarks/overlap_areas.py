@@ -0,0 +1,86 @@
+"""
+Benchmarks the overlap engine against the original pandas pair loop and checks that the totals match.
+
+Run from the service root:
+    python -m benchmarks.overlap_areas --counts 50 150 400 1000 4000
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from itertools import combinations
+from time import perf_counter
+
+from src.commands.common.overlap import pairwise_overlapping_area, sweep_overlapping_area, total_overlapping_area
+
+
+def legacy_overlapping_area(metadata):
+    df_metadata = pd.DataFrame(metadata)
+
+    def compute_overlapping_area(rect1, rect2):
+        x_overlap = max(0, min(rect1['x2'], rect2['x2']) - max(rect1['x1'], rect2['x1']))
+        y_overlap = max(0, min(rect1['y2'], rect2['y2']) - max(rect1['y1'], rect2['y1']))
+        return x_overlap * y_overlap
+
+    overlapped_areas = []
+    for i, j in combinations(df_metadata.index, 2):
+        overlapped_areas.append(compute_overlapping_area(df_metadata.loc[i], df_metadata.loc[j]))
+    return sum(overlapped_areas)
+
+
+def shelf_boxes(count, seed=0, width=3840, height=2160):
+    # Roughly SKU110K-like: boxes laid out on shelf rows with jitter, so neighbours overlap a little
+    rng = np.random.default_rng(seed)
+    rows = max(1, int(np.sqrt(count / 4)))
+    per_row = int(np.ceil(count / rows))
+    box_w = width / per_row
+    box_h = height / rows
+
+    index = np.arange(count)
+    x1 = (index % per_row) * box_w + rng.normal(0, box_w * 0.1, count)
+    y1 = (index // per_row) * box_h + rng.normal(0, box_h * 0.05, count)
+    x2 = x1 + box_w * rng.uniform(0.8, 1.2, count)
+    y2 = y1 + box_h * rng.uniform(0.8, 1.1, count)
+    return [
+        {"x1": int(a), "y1": int(b), "x2": int(c), "y2": int(d), "confidence": 0.9, "class_id": 0, "label": "retail 0.90"}
+        for a, b, c, d in zip(x1, y1, x2, y2)
+    ]
+
+
+def timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        value = function()
+        best = min(best, perf_counter() - start)
+    return best, value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=[50, 150, 400, 1000, 4000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-limit", type=int, default=400, help="largest count timed with the pandas loop")
+    args = parser.parse_args()
+
+    for count in args.counts:
+        metadata = shelf_boxes(count)
+        columns = [np.array([box[key] for box in metadata]) for key in ("x1", "y1", "x2", "y2")]
+
+        runs = {
+            "pairwise": lambda: pairwise_overlapping_area(*columns),
+            "sweep": lambda: sweep_overlapping_area(*columns),
+            "auto": lambda: total_overlapping_area(*columns),
+        }
+        if count <= args.legacy_limit:
+            runs["legacy"] = lambda: legacy_overlapping_area(metadata)
+
+        timings = {name: timed(function, args.repeat) for name, function in runs.items()}
+        totals = {value for _, value in timings.values()}
+        assert len(totals) == 1, f"overlap totals differ for {count} boxes: {timings}"
+
+        summary = "  ".join(f"{name} {elapsed * 1000:9.2f} ms" for name, (elapsed, _) in timings.items())
+        print(f"{count:6d} boxes  {summary}")
+
+
+if __name__ == "__main__":
+    main()
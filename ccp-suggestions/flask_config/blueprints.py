@@ -1,24 +1,83 @@
 import sys
 from base64 import b64decode
+from hmac import compare_digest
 from flask import Blueprint, jsonify, request
 from json import loads
-from src.commands.image_prediction import PredictionModel
+from os import getenv
+from src.commands.fused_pipeline import prediction_command
 from src.commands.generate_recommendation import GenerateRecommendations
 from src.commands.send_email import SendEmail
+from src.commands.common.jobs import JobQueue, JobQueueFull
+from src.commands.common.model_registry import activate_model, registry_status
+from src.static.constants import jobs_max_workers, jobs_max_pending, jobs_history_size
 
 blueprint = Blueprint('recommendations', __name__)
+prediction_jobs = JobQueue(jobs_max_workers, jobs_max_pending, jobs_history_size)
 
 @blueprint.get('/ping')
 def health_check():
     return jsonify({'message': 'El servicio está activo'}), 200
 
+@blueprint.get('/model')
+def model_status():
+    return jsonify(registry_status()), 200
+
+@blueprint.post('/model')
+def swap_model():
+    # The hot swap is off unless MODEL_ADMIN_TOKEN is set, and then needs it as a bearer token,
+    # since this service also takes the unauthenticated Pub/Sub pushes
+    admin_token = getenv('MODEL_ADMIN_TOKEN')
+    if not admin_token:
+        return jsonify({'message': 'El cambio de modelo no está habilitado'}), 404
+    if not compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {admin_token}'.encode()):
+        return jsonify({'message': 'No autorizado'}), 401
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('version'), (str, type(None))):
+        return jsonify({'message': 'El cuerpo debe ser un objeto JSON con la versión del modelo'}), 400
+
+    try:
+        activate_model(body.get('version'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'message': str(e)}), 404
+    return jsonify(registry_status()), 200
+
 @blueprint.post('/predict')
 def predict_model():
     body = request.get_json()
+    if getenv('PREDICT_MODE') == 'async':
+        return enqueue_prediction(body)
+
     body = loads(b64decode(body.get('message').get('data')))
-    r = PredictionModel(body).execute()
+    r = prediction_command()(body).execute()
     return jsonify(r['response']), r['status_code']
 
+def enqueue_prediction(body):
+    try:
+        body = loads(b64decode(body['message']['data']))
+        missing = [key for key in ('BlobPath', 'Customer', 'Seller') if key not in body]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'El mensaje recibido no es válido'}), 400
+    if missing:
+        return jsonify({'message': f"Faltan campos en el mensaje: {', '.join(missing)}"}), 400
+
+    try:
+        job = prediction_jobs.submit(prediction_command(), body)
+    except JobQueueFull:
+        # Any non-success status makes Pub/Sub back off and redeliver later
+        return jsonify({'message': 'La cola de procesamiento está llena'}), 429, {'Retry-After': '30'}
+
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+@blueprint.get('/jobs/<job_id>')
+def job_status(job_id):
+    job = prediction_jobs.get(job_id)
+    if job is None:
+        return jsonify({'message': 'No se encontró el trabajo'}), 404
+    return jsonify(job.to_dict()), 200
+
 @blueprint.post('/recommendations')
 def create_recommendations():
     body = request.get_json()
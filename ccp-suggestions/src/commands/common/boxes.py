@@ -0,0 +1,85 @@
+import numpy as np
+from functools import cached_property
+
+from src.commands.common.overlap import total_overlapping_area
+
+
+def _widen(values):
+    # Coordinates may arrive as narrow integers from compact payloads, so derived columns are widened first
+    if values.dtype.kind in "biu":
+        return values.astype(np.int64, copy=False)
+    return values.astype(np.float64, copy=False)
+
+
+class BoxSet:
+    """
+    Columnar container for the boxes detected in one image. Coordinates, confidences and classes
+    live in NumPy arrays, and the columns the shelf metrics derive from them are computed once on
+    first access and cached.
+    """
+
+    def __init__(self, x1, y1, x2, y2, confidence=None, class_id=None, labels=None):
+        self.x1 = np.asarray(x1)
+        self.y1 = np.asarray(y1)
+        self.x2 = np.asarray(x2)
+        self.y2 = np.asarray(y2)
+        self.confidence = np.zeros(len(self.x1)) if confidence is None else np.asarray(confidence)
+        self.class_id = np.zeros(len(self.x1), dtype=np.int64) if class_id is None else np.asarray(class_id)
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.x1)
+
+    @classmethod
+    def from_records(cls, records):
+        coordinates = np.array(
+            [(box["x1"], box["y1"], box["x2"], box["y2"]) for box in records], dtype=np.int64
+        ).reshape(-1, 4).T.copy()
+        confidence = np.array([box.get("confidence", 0.0) for box in records], dtype=np.float64)
+        class_id = np.array([box.get("class_id", 0) for box in records], dtype=np.int64)
+        labels = [box.get("label") for box in records]
+        return cls(*coordinates, confidence, class_id, labels)
+
+    @classmethod
+    def from_result(cls, result, names):
+        boxes = result.boxes
+        coordinates = np.asarray(boxes.xyxy).astype(np.int64).reshape(-1, 4).T.copy()
+        confidence = np.asarray(boxes.conf).astype(np.float64)
+        class_id = np.asarray(boxes.cls).astype(np.int64)
+        labels = [f"{names[cls]} {conf:.2f}" for cls, conf in zip(class_id.tolist(), confidence.tolist())]
+        return cls(*coordinates, confidence, class_id, labels)
+
+    def to_records(self):
+        labels = self.labels if self.labels is not None else [None] * len(self)
+        return [
+            {"x1": x1, "y1": y1, "x2": x2, "y2": y2, "confidence": conf, "class_id": cls, "label": label}
+            for x1, y1, x2, y2, conf, cls, label in zip(
+                self.x1.tolist(), self.y1.tolist(), self.x2.tolist(), self.y2.tolist(),
+                self.confidence.tolist(), self.class_id.tolist(), labels
+            )
+        ]
+
+    @cached_property
+    def length(self):
+        return _widen(self.x2) - _widen(self.x1)
+
+    @cached_property
+    def height(self):
+        return _widen(self.y2) - _widen(self.y1)
+
+    @cached_property
+    def area(self):
+        return self.length * self.height
+
+    @cached_property
+    def extent(self):
+        return _widen(self.x1).min(), _widen(self.y1).min(), _widen(self.x2).max(), _widen(self.y2).max()
+
+    @cached_property
+    def spread_area(self):
+        x1, y1, x2, y2 = self.extent
+        return (x2 - x1) * (y2 - y1)
+
+    @cached_property
+    def overlapping_area(self):
+        return total_overlapping_area(self.x1, self.y1, self.x2, self.y2)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+from threading import Lock, get_ident
+from urllib.parse import unquote, urlparse
+from google.api_core.exceptions import NotFound
+
+from src.static.constants import (
+    prediction_cache_enabled, prediction_cache_dir, prediction_cache_max_entries, prediction_cache_gcs_prefix,
+    detections_format, keyframe_candidates, snap_keyframes, keyframe_score_width, keyframe_duplicate_distance,
+    prediction_num_frames, prediction_top_frames, annotation_renderer, bucket_image_folder, onnx_conf_threshold,
+    onnx_iou_threshold, onnx_max_det, onnx_pre_nms_top_k, onnx_tiled
+)
+from src.commands.common.gcs import get_bucket, get_client, transfer_retry, upload_many
+from src.commands.common.model_registry import backend_name, resolve_model_path
+
+_disk_lock = Lock()
+
+# Hosts that serve GCS objects over HTTPS as /<bucket>/<object>, signed or not
+gcs_hosts = ("storage.googleapis.com", "storage.cloud.google.com")
+
+
+def _gcs_location(blob_path):
+    url = urlparse(blob_path)
+    if url.scheme == "gs":
+        return url.netloc, unquote(url.path.lstrip("/"))
+    if url.scheme in ("http", "https") and url.netloc in gcs_hosts:
+        bucket, _, name = unquote(url.path.lstrip("/")).partition("/")
+        return bucket, name
+    return None
+
+
+def content_id(blob_path):
+    """
+    Identifies the video behind a BlobPath without decoding it: the object generation for GCS
+    objects, which changes on every overwrite, or the SHA-256 of a local file. Anything else has
+    no stable identity and returns None, which bypasses the cache.
+    """
+    if os.path.isfile(blob_path):
+        digest = hashlib.sha256()
+        with open(blob_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return f"sha256:{digest.hexdigest()}"
+
+    location = _gcs_location(blob_path)
+    if location is None:
+        return None
+
+    bucket, name = location
+    try:
+        blob = get_client().bucket(bucket).get_blob(name, retry=transfer_retry)
+    except Exception as e:
+        print(f"Could not read the generation of {blob_path}: {e}")
+        return None
+    if blob is None:
+        return None
+    return f"gcs:{bucket}/{name}#{blob.generation}"
+
+
+def prediction_key(blob_path, model_version):
+    """
+    Cache key of a prediction: the video content, the model weights that would process it and
+    the settings that shape the published artifacts. Returns None when the video has no identity.
+    """
+    if not prediction_cache_enabled:
+        return None
+
+    content = content_id(blob_path)
+    if content is None:
+        return None
+
+    # The weights file is stamped too, so replacing the default model in place misses the cache
+    weights = resolve_model_path(model_version)
+    weights_stamp = os.stat(weights).st_mtime_ns if os.path.isfile(weights) else None
+
+    key = json.dumps({
+        "content": content,
+        "model": [backend_name(), model_version, weights, weights_stamp],
+        # Every setting that changes which frames are picked, what is detected on them or how the
+        # uploaded frames and detections look
+        "settings": {
+            "frames": [prediction_num_frames, prediction_top_frames, keyframe_candidates, snap_keyframes,
+                       keyframe_score_width, keyframe_duplicate_distance],
+            "detection": [onnx_conf_threshold, onnx_iou_threshold, onnx_max_det, onnx_pre_nms_top_k, onnx_tiled],
+            "output": [detections_format, annotation_renderer, bucket_image_folder],
+        },
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _disk_path(key):
+    return os.path.join(prediction_cache_dir, f"{key}.json")
+
+
+def _read_disk(key):
+    entry_path = _disk_path(key)
+    try:
+        with open(entry_path, "rb") as f:
+            entry = json.loads(f.read())
+        # Reads refresh the modification time, which is what eviction orders by
+        os.utime(entry_path)
+        return entry
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        # A corrupt entry is dropped and recomputed
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            pass
+        return None
+
+
+def _write_disk(key, data):
+    os.makedirs(prediction_cache_dir, exist_ok=True)
+    entry_path = _disk_path(key)
+    temporary_path = f"{entry_path}.{os.getpid()}.{get_ident()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(data)
+    os.replace(temporary_path, entry_path)
+
+    with _disk_lock:
+        entries = [
+            os.path.join(prediction_cache_dir, name)
+            for name in os.listdir(prediction_cache_dir) if name.endswith(".json")
+        ]
+        if len(entries) <= prediction_cache_max_entries:
+            return
+
+        def modified(entry):
+            try:
+                return os.path.getmtime(entry)
+            except FileNotFoundError:
+                return 0
+
+        # Least recently used first
+        for entry in sorted(entries, key=modified)[:len(entries) - prediction_cache_max_entries]:
+            try:
+                os.remove(entry)
+            except FileNotFoundError:
+                pass
+
+
+def lookup(key):
+    """
+    Returns the artifacts published for a cached prediction, from the local disk first and then
+    from the GCS tier when prediction_cache_gcs_prefix is set. A GCS hit is copied to disk.
+    """
+    if key is None:
+        return None
+
+    entry = _read_disk(key)
+    if entry is None and prediction_cache_gcs_prefix:
+        try:
+            data = get_bucket().blob(f"{prediction_cache_gcs_prefix}/{key}.json").download_as_bytes(retry=transfer_retry)
+        except NotFound:
+            return None
+        _write_disk(key, data)
+        entry = json.loads(data)
+
+    return entry["artifacts"] if entry is not None else None
+
+
+def store(key, artifacts):
+    if key is None:
+        return
+
+    data = json.dumps({"artifacts": artifacts}).encode("utf-8")
+    _write_disk(key, data)
+    if prediction_cache_gcs_prefix:
+        upload_many([(f"{prediction_cache_gcs_prefix}/{key}.json", data, "application/json")])
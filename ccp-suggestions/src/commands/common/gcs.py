@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from threading import Lock
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+from google.cloud.storage.retry import DEFAULT_RETRY
+from requests.adapters import HTTPAdapter
+
+from src.static.constants import bucket_name, storage_max_workers, storage_retry_deadline
+
+_client = None
+_client_lock = Lock()
+_executor = ThreadPoolExecutor(max_workers=storage_max_workers, thread_name_prefix="gcs")
+
+# Exponential backoff on transient errors. Uploads are not retried by the library unless they
+# are conditional, so the policy is always passed explicitly
+transfer_retry = DEFAULT_RETRY.with_delay(initial=0.5, maximum=8.0, multiplier=2.0).with_deadline(storage_retry_deadline)
+
+
+def _create_client():
+    emulator_host = getenv("STORAGE_EMULATOR_HOST")
+    if emulator_host:
+        # Local fake GCS server, e.g. fsouza/fake-gcs-server
+        client = storage.Client(
+            project=getenv("GOOGLE_CLOUD_PROJECT", "test"),
+            credentials=AnonymousCredentials(),
+            client_options={"api_endpoint": emulator_host}
+        )
+    else:
+        client = storage.Client()
+
+    # requests keeps 10 connections per host by default; size the pool to the transfer threads so
+    # parallel transfers reuse warm connections instead of opening new ones
+    adapter = HTTPAdapter(pool_connections=storage_max_workers, pool_maxsize=storage_max_workers)
+    client._http.mount("https://", adapter)
+    client._http.mount("http://", adapter)
+    return client
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def get_bucket(name=bucket_name):
+    return get_client().bucket(name)
+
+
+def upload_many(uploads, bucket=None):
+    """
+    Uploads (blob_name, data, content_type) items in parallel. Data can be bytes, a string or a
+    seekable file object. Returns the blob names in the same order.
+    """
+    bucket = bucket or get_bucket()
+
+    def upload(item):
+        blob_name, data, content_type = item
+        blob = bucket.blob(blob_name)
+        if hasattr(data, "read"):
+            data.seek(0)
+            blob.upload_from_file(data, content_type=content_type, retry=transfer_retry)
+        else:
+            blob.upload_from_string(data, content_type=content_type, retry=transfer_retry)
+        return blob_name
+
+    return list(_executor.map(upload, uploads))
+
+
+def download_many(blob_names, bucket=None):
+    bucket = bucket or get_bucket()
+
+    def download(blob_name):
+        return bucket.blob(blob_name).download_as_bytes(retry=transfer_retry)
+
+    return list(_executor.map(download, blob_names))
@@ -0,0 +1,76 @@
+import numpy as np
+from ast import literal_eval
+from types import SimpleNamespace
+
+from src.static.constants import (
+    onnx_conf_threshold, onnx_iou_threshold, onnx_max_det, onnx_pre_nms_top_k, onnx_tiled, onnx_intra_op_threads,
+    onnx_inter_op_threads
+)
+
+
+class UltralyticsBackend:
+    extension = "pt"
+
+    def __init__(self, weights):
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights)
+        self.names = self.model.names
+
+    def __call__(self, source, **kwargs):
+        return self.model(source, **kwargs)
+
+
+class OnnxBackend:
+    """
+    Serves an exported ONNX model through the yolov8 detector from model-training/testing, so the
+    service image does not need torch or ultralytics. Results carry the same boxes.xyxy, boxes.conf
+    and boxes.cls fields as ultralytics results.
+    """
+    extension = "onnx"
+
+    def __init__(self, weights):
+        import onnxruntime
+        from src.yolov8 import YOLOv8
+        from src.yolov8.utils import class_names
+
+        # 0 leaves the thread count to onnxruntime, which uses every core
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = onnx_intra_op_threads
+        options.inter_op_num_threads = onnx_inter_op_threads
+
+        # Per-class NMS over at most onnx_pre_nms_top_k candidates, capped at onnx_max_det boxes,
+        # as ultralytics predicts by default. onnx_tiled slices large frames into input-sized tiles
+        self.detector = YOLOv8(
+            weights, conf_thres=onnx_conf_threshold, iou_thres=onnx_iou_threshold,
+            providers=["CPUExecutionProvider"], session_options=options,
+            class_aware=True, max_det=onnx_max_det, pre_nms_top_k=onnx_pre_nms_top_k, tiled=onnx_tiled
+        )
+
+        # ultralytics writes the class names into the exported model metadata
+        metadata = self.detector.session.get_modelmeta().custom_metadata_map
+        self.names = literal_eval(metadata["names"]) if "names" in metadata else dict(enumerate(class_names))
+
+    def __call__(self, source, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+
+        results = []
+        for frame in frames:
+            boxes, scores, class_ids = self.detector(frame)
+            height, width = frame.shape[:2]
+            # ultralytics clips boxes to the image, so the ONNX path does the same
+            xyxy = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+            np.clip(xyxy[:, 0::2], 0, width, out=xyxy[:, 0::2])
+            np.clip(xyxy[:, 1::2], 0, height, out=xyxy[:, 1::2])
+            results.append(SimpleNamespace(boxes=SimpleNamespace(
+                xyxy=xyxy,
+                conf=np.asarray(scores, dtype=np.float32),
+                cls=np.asarray(class_ids, dtype=np.int64)
+            )))
+        return results
+
+
+backends = {
+    "ultralytics": UltralyticsBackend,
+    "onnx": OnnxBackend,
+}
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from time import time
+from uuid import uuid4
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, command_class, body):
+        self.id = uuid4().hex
+        self.command_class = command_class
+        self.body = body
+        self.status = "queued"
+        self.command = None
+        self.response = None
+        self.error = None
+        self.created_at = time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        # Commands that track their progress expose `stage` and `timings` while they run
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": getattr(self.command, "stage", None),
+            "timings": dict(getattr(self.command, "timings", {})),
+            "response": self.response,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Runs commands on a bounded thread pool. At most max_workers jobs run and max_pending wait;
+    submitting beyond that raises JobQueueFull so callers can push back. The last history_size
+    jobs stay available for status queries.
+    """
+
+    def __init__(self, max_workers, max_pending, history_size):
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="jobs")
+        self._slots = BoundedSemaphore(max_workers + max_pending)
+        self._jobs = OrderedDict()
+        self._lock = Lock()
+
+    def submit(self, command_class, body):
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull("Job queue is full")
+
+        job = Job(command_class, body)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history_size:
+                self._jobs.popitem(last=False)
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = "running"
+        job.started_at = time()
+        try:
+            job.command = job.command_class(job.body)
+            r = job.command.execute()
+            job.response = r["response"]
+            job.status = "done"
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time()
+            self._slots.release()
@@ -0,0 +1,110 @@
+"""
+Per-job detection manifest. Every frame's boxes are stored together as one set of columns:
+
+    magic (4 bytes) | header length (uint32) | JSON header | padding | column data
+
+The header holds the class names, the frame index (image name, first row, row count) and the
+dtype and offset of each column. Coordinates are int16 when they fit, confidences float16 and
+class ids uint16, and every column starts on an 8 byte boundary so it can be read in place.
+"""
+
+import json
+import numpy as np
+from struct import Struct
+
+from src.commands.common.boxes import BoxSet
+
+MAGIC = b"CCPM"
+_prefix = Struct("<4sI")
+_alignment = 8
+
+
+def _align(offset):
+    return (offset + _alignment - 1) // _alignment * _alignment
+
+
+def _coordinate_dtype(values):
+    info = np.iinfo(np.int16)
+    if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+        return np.dtype("<i2")
+    return np.dtype("<i4")
+
+
+def _concatenate(boxes, column):
+    if not boxes:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([getattr(box_set, column) for box_set in boxes])
+
+
+def build_manifest(frames, names):
+    """`frames` is a list of (image name, BoxSet) pairs; `names` maps class ids to class names."""
+    boxes = [box_set for _, box_set in frames]
+    columns = {column: _concatenate(boxes, column) for column in ("x1", "y1", "x2", "y2")}
+    coordinate_dtype = max((_coordinate_dtype(values) for values in columns.values()), key=lambda dtype: dtype.itemsize)
+
+    columns = {column: values.astype(coordinate_dtype) for column, values in columns.items()}
+    columns["confidence"] = _concatenate(boxes, "confidence").astype("<f2")
+    columns["class_id"] = _concatenate(boxes, "class_id").astype("<u2")
+
+    index = []
+    start = 0
+    for image, box_set in frames:
+        index.append({"image": image, "start": start, "count": len(box_set)})
+        start += len(box_set)
+
+    layout = []
+    offset = 0
+    for column, values in columns.items():
+        layout.append({"name": column, "dtype": values.dtype.str, "offset": offset})
+        offset = _align(offset + values.nbytes)
+
+    header = json.dumps({
+        "version": 1,
+        "count": start,
+        "names": {str(class_id): name for class_id, name in dict(names).items()},
+        "frames": index,
+        "columns": layout,
+    }).encode("utf-8")
+
+    data_start = _align(_prefix.size + len(header))
+    buffer = bytearray(data_start + offset)
+    _prefix.pack_into(buffer, 0, MAGIC, len(header))
+    buffer[_prefix.size:_prefix.size + len(header)] = header
+    for column, values in zip(layout, columns.values()):
+        position = data_start + column["offset"]
+        buffer[position:position + values.nbytes] = values.tobytes()
+
+    return bytes(buffer)
+
+
+def is_manifest(buffer):
+    return bytes(buffer[:len(MAGIC)]) == MAGIC
+
+
+def load_manifest(buffer):
+    """
+    Returns [{"name": image, "boxes": BoxSet}] in frame order. Columns are read-only views over
+    `buffer`, so nothing is copied or parsed per box.
+    """
+    magic, header_length = _prefix.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a detection manifest")
+
+    header = json.loads(bytes(buffer[_prefix.size:_prefix.size + header_length]).decode("utf-8"))
+    data_start = _align(_prefix.size + header_length)
+    columns = {
+        column["name"]: np.frombuffer(
+            buffer, dtype=np.dtype(column["dtype"]), count=header["count"], offset=data_start + column["offset"]
+        )
+        for column in header["columns"]
+    }
+
+    frames = []
+    for frame in header["frames"]:
+        rows = slice(frame["start"], frame["start"] + frame["count"])
+        boxes = BoxSet(
+            columns["x1"][rows], columns["y1"][rows], columns["x2"][rows], columns["y2"][rows],
+            columns["confidence"][rows], columns["class_id"][rows]
+        )
+        frames.append({"name": frame["image"], "boxes": boxes})
+    return frames
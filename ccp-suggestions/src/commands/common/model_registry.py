@@ -0,0 +1,153 @@
+import numpy as np
+from collections import OrderedDict
+from os import getenv, path
+from threading import Lock
+
+from src.static.constants import (
+    model_path, onnx_model_path, model_versions_dir, model_warmup_size, inference_backend, model_cache_max_versions
+)
+from src.commands.common.inference_backends import backends
+
+# Marks that no version was activated yet, so MODEL_VERSION decides. None is a real version:
+# the default weights
+_UNSET = object()
+
+# Loaded models by version, least recently used first. _registry_lock only guards these dicts and
+# is never held while a model loads; each version loads under its own lock in _loading_locks
+_models = OrderedDict()
+_loading_locks = {}
+_registry_lock = Lock()
+_active_version = _UNSET
+
+
+class RegisteredModel:
+    def __init__(self, version, model):
+        self.version = version
+        self.model = model
+        self.names = model.names
+        self._inference_lock = Lock()
+
+    def __call__(self, source, **kwargs):
+        # Both backends keep per-call state (the ultralytics predictor, the ONNX detector's last
+        # boxes), so two waitress threads must not run the same model instance at once
+        with self._inference_lock:
+            return self.model(source, **kwargs)
+
+    def warm_up(self):
+        frame = np.zeros((model_warmup_size, model_warmup_size, 3), dtype=np.uint8)
+        self(frame, save=False, verbose=False)
+
+
+def active_version():
+    # MODEL_VERSION is read lazily because .env is loaded after this module is imported
+    if _active_version is not _UNSET:
+        return _active_version
+    return getenv('MODEL_VERSION')
+
+
+def backend_name():
+    return getenv('INFERENCE_BACKEND', inference_backend)
+
+
+def validate_version(version):
+    """
+    A version comes from request bodies and messages, so it must name a directory directly under
+    model_versions_dir. Anything that could point elsewhere is rejected before touching the disk.
+    """
+    if (not isinstance(version, str) or version in ("", ".", "..")
+            or any(separator in version for separator in ("/", "\\", "\0"))):
+        raise ValueError(f"Invalid model version: {version!r}")
+    if not path.isdir(path.join(model_versions_dir, version)):
+        raise FileNotFoundError(f"Model version not found: {version}")
+    return version
+
+
+def resolve_model_path(version=None):
+    backend = backends[backend_name()]
+    if version is None:
+        return onnx_model_path if backend.extension == "onnx" else model_path
+    return path.join(model_versions_dir, validate_version(version), "weights", f"best.{backend.extension}")
+
+
+def _evict_models(keep):
+    # Called with _registry_lock held. The active model and the one just loaded are never evicted
+    active = active_version()
+    for version in list(_models):
+        if len(_models) <= model_cache_max_versions:
+            break
+        if version != active and version != keep:
+            del _models[version]
+
+
+def _cached_model(version):
+    with _registry_lock:
+        model = _models.get(version)
+        if model is not None:
+            _models.move_to_end(version)
+        return model
+
+
+def load_model(version=None):
+    """
+    Loads and warms up a version once. Threads asking for the same version wait for the one
+    loading it, while requests for models already loaded are never blocked by the load.
+    """
+    model = _cached_model(version)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        loading_lock = _loading_locks.setdefault(version, Lock())
+
+    with loading_lock:
+        model = _cached_model(version)
+        if model is not None:
+            return model
+
+        weights = resolve_model_path(version)
+        if not path.isfile(weights):
+            raise FileNotFoundError(f"Model weights not found: {weights}")
+
+        model = RegisteredModel(version, backends[backend_name()](weights))
+        model.warm_up()
+
+        with _registry_lock:
+            _models[version] = model
+            _evict_models(version)
+            _loading_locks.pop(version, None)
+        return model
+
+
+def get_model(version=_UNSET):
+    if version is _UNSET:
+        version = active_version()
+    return load_model(version)
+
+
+def activate_model(version, unload_previous=True):
+    """
+    Loads and warms up a model version before pointing new requests to it, so the swap
+    never exposes a cold model. Requests already running keep their own reference to the
+    previous model until they finish.
+    """
+    global _active_version
+    model = load_model(version)
+
+    with _registry_lock:
+        previous = active_version()
+        _active_version = version
+        # A load of another version may have evicted it while this one warmed up
+        _models[version] = model
+        _models.move_to_end(version)
+        if unload_previous and previous != version:
+            _models.pop(previous, None)
+
+    return model
+
+
+def registry_status():
+    return {
+        "backend": backend_name(),
+        "active_version": active_version(),
+        "loaded_versions": list(_models.keys())
+    }
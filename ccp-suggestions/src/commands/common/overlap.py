@@ -0,0 +1,84 @@
+import numpy as np
+
+# Below this many boxes the chunked pairwise pass is faster than sorting
+sweep_threshold = 64
+# Upper bound of pairs (rows x columns or candidate pairs) held in memory at once
+pair_budget = 1 << 18
+
+
+def _as_coordinates(values):
+    values = np.asarray(values)
+    if values.dtype.kind in "biu":
+        return values.astype(np.int64, copy=False)
+    return values.astype(np.float64, copy=False)
+
+
+def _intersections(x1a, y1a, x2a, y2a, x1b, y1b, x2b, y2b):
+    width = np.minimum(x2a, x2b) - np.maximum(x1a, x1b)
+    height = np.minimum(y2a, y2b) - np.maximum(y1a, y1b)
+    np.maximum(width, 0, out=width)
+    np.maximum(height, 0, out=height)
+    width *= height
+    return width
+
+
+def pairwise_overlapping_area(x1, y1, x2, y2):
+    """
+    Sums the intersection area of every pair of boxes by broadcasting blocks of rows against the
+    boxes after them, so only pair_budget intersections are materialized at a time.
+    """
+    n = len(x1)
+    total = 0
+    chunk = max(1, pair_budget // max(n, 1))
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        areas = _intersections(
+            x1[start:stop, None], y1[start:stop, None], x2[start:stop, None], y2[start:stop, None],
+            x1[None, start:], y1[None, start:], x2[None, start:], y2[None, start:]
+        )
+        # Row r is box start + r and column c is box start + c, so pairs i < j sit above the diagonal
+        total += np.triu(areas, k=1).sum()
+    return total
+
+
+def sweep_overlapping_area(x1, y1, x2, y2):
+    """
+    Sort-and-sweep over x: after sorting by x1, box j can only overlap an earlier box i when
+    x1[j] < x2[i], so each box is only compared with the run of boxes that start inside it.
+    Runs in O(n log n + k) for k candidate pairs.
+    """
+    n = len(x1)
+    order = np.argsort(x1, kind="stable")
+    x1, y1, x2, y2 = x1[order], y1[order], x2[order], y2[order]
+
+    ends = np.searchsorted(x1, x2, side="left")
+    counts = np.maximum(ends - np.arange(n) - 1, 0)
+    cumulative = np.cumsum(counts)
+
+    total = 0
+    start = 0
+    while start < n:
+        done = cumulative[start - 1] if start else 0
+        stop = int(np.searchsorted(cumulative, done + pair_budget, side="right"))
+        stop = min(max(stop, start + 1), n)
+
+        rows = np.arange(start, stop)
+        row_counts = counts[start:stop]
+        pairs = int(row_counts.sum())
+        if pairs:
+            first = np.repeat(rows, row_counts)
+            offsets = np.arange(pairs) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+            second = first + 1 + offsets
+            total += _intersections(
+                x1[first], y1[first], x2[first], y2[first],
+                x1[second], y1[second], x2[second], y2[second]
+            ).sum()
+        start = stop
+    return total
+
+
+def total_overlapping_area(x1, y1, x2, y2):
+    x1, y1, x2, y2 = (_as_coordinates(values) for values in (x1, y1, x2, y2))
+    if len(x1) >= sweep_threshold:
+        return sweep_overlapping_area(x1, y1, x2, y2)
+    return pairwise_overlapping_area(x1, y1, x2, y2)
@@ -1,12 +1,86 @@
+import atexit
+from collections import defaultdict
+from concurrent.futures import Future
 from json import dumps
 from os import getenv
+from threading import Lock
 from google.cloud import pubsub_v1
 
-def publish_message(topic_name, message: dict):
+from src.static.constants import (
+    pubsub_batch_max_messages, pubsub_batch_max_bytes, pubsub_batch_max_latency, pubsub_wait_for_publish
+)
+
+_publisher = None
+_publisher_lock = Lock()
+
+
+class InMemoryPublisher:
+    """
+    Stand-in for PublisherClient selected with PUBSUB_BACKEND=memory. Messages are kept per topic
+    path and their futures resolve immediately.
+    """
+
+    def __init__(self):
+        self.messages = defaultdict(list)
+        self._lock = Lock()
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic, data, **attributes):
+        with self._lock:
+            self.messages[topic].append({"data": data, "attributes": attributes})
+            message_id = str(sum(len(messages) for messages in self.messages.values()))
+
+        future = Future()
+        future.set_result(message_id)
+        return future
+
+    def stop(self):
+        pass
+
+
+def get_publisher():
+    # PublisherClient picks up PUBSUB_EMULATOR_HOST on its own, so the emulator needs no extra setup
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                if getenv('PUBSUB_BACKEND') == 'memory':
+                    _publisher = InMemoryPublisher()
+                else:
+                    batch_settings = pubsub_v1.types.BatchSettings(
+                        max_messages=pubsub_batch_max_messages,
+                        max_bytes=pubsub_batch_max_bytes,
+                        max_latency=pubsub_batch_max_latency,
+                    )
+                    _publisher = pubsub_v1.PublisherClient(batch_settings=batch_settings)
+    return _publisher
+
+
+def shutdown_publisher():
+    """Sends every batch still pending and closes the shared publisher."""
+    global _publisher
+    with _publisher_lock:
+        publisher, _publisher = _publisher, None
+
+    if publisher is not None:
+        publisher.stop()
+
+
+atexit.register(shutdown_publisher)
+
+
+def _report_publish_failure(future):
+    if future.exception() is not None:
+        print(f"Failed to publish message: {future.exception()}")
+
+
+def publish_message(topic_name, message: dict, wait: bool = pubsub_wait_for_publish, callback=None):
     project_id = getenv('GOOGLE_CLOUD_PROJECT')
     topic = topic_name
 
-    publisher = pubsub_v1.PublisherClient()
+    publisher = get_publisher()
     topic_path = publisher.topic_path(project_id, topic)
 
     message_bytes = dumps(message).encode('utf-8')
@@ -15,6 +89,10 @@ def publish_message(topic_name, message: dict):
         "content-type": "application/json"
     }
     future = publisher.publish(topic_path, data=message_bytes, **attributes)
+    future.add_done_callback(callback or _report_publish_failure)
+
+    if not wait:
+        return f"Queued message for topic: {topic}"
     return f"Published message ID: {future.result()}"
 
 def pull_single_message(subscription_name):
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from json import loads
+from os import getenv
+from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
+
+from src.static.constants import worker_threads, worker_max_messages, worker_max_bytes, worker_max_lease_duration
+
+
+def _dispatch(command, message):
+    # Messages are acked only once the command finished; a failure is nacked so Pub/Sub redelivers it
+    try:
+        body = loads(message.data.decode('utf-8'))
+        command(body).execute()
+    except Exception as e:
+        print(f"Failed to process message {message.message_id}: {e}")
+        message.nack()
+        return
+
+    message.ack()
+
+
+def run_worker(commands):
+    """
+    Streams messages from each subscription into its own worker pool until interrupted.
+    `commands` maps subscription names to the command class that handles their messages.
+    Flow control caps the messages and bytes held per subscription, and the client keeps extending
+    the ack deadline of every held message for up to worker_max_lease_duration seconds, which covers
+    long videos.
+    """
+    project_id = getenv('GOOGLE_CLOUD_PROJECT')
+    subscriber = pubsub_v1.SubscriberClient()
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=worker_max_messages,
+        max_bytes=worker_max_bytes,
+        max_lease_duration=worker_max_lease_duration,
+    )
+
+    futures = []
+    for subscription_name, command in commands.items():
+        subscription_path = subscriber.subscription_path(project_id, subscription_name)
+        scheduler = ThreadScheduler(
+            ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix=subscription_name)
+        )
+        futures.append(subscriber.subscribe(
+            subscription_path,
+            callback=partial(_dispatch, command),
+            flow_control=flow_control,
+            scheduler=scheduler,
+        ))
+        print(f"Listening for messages on {subscription_path}")
+
+    with subscriber:
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+                future.result()
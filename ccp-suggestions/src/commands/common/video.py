@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+from bisect import bisect_left, bisect_right
+
+from src.static.constants import keyframe_score_width, keyframe_duplicate_distance
+
+
+def sample_indices(total_frames, num_frames):
+    step = max(1, total_frames // num_frames)
+    return [index * step for index in range(num_frames)]
+
+
+def scan_key_frames(video_path):
+    """
+    Lists the indices of the frames stored as key frames (I-frames). The capture is opened in raw
+    mode, so grab() only demuxes packets and nothing is decoded.
+    """
+    capture = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    capture.set(cv2.CAP_PROP_FORMAT, -1)
+
+    key_frames = []
+    index = 0
+    while capture.grab():
+        if capture.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+            key_frames.append(index)
+        index += 1
+
+    capture.release()
+    return key_frames
+
+
+def snap_to_key_frames(indices, key_frames):
+    if not key_frames:
+        return indices
+
+    snapped = []
+    for index in indices:
+        position = bisect_left(key_frames, index)
+        candidates = key_frames[max(0, position - 1):position + 1]
+        nearest = min(candidates, key=lambda key_frame: abs(key_frame - index))
+        if nearest not in snapped:
+            snapped.append(nearest)
+    return snapped
+
+
+def read_frames(capture, indices, key_frames=None):
+    """
+    Yields (index, frame) for the requested indices decoding the stream forward only once.
+    Frames in between are skipped with grab(), and only the targets pay for retrieve(). When the
+    key frames are known, long gaps jump straight to the last key frame before the target, which
+    is the only place a seek does not have to decode anything again.
+    """
+    position = 0
+    for target in sorted(set(indices)):
+        if key_frames:
+            previous = bisect_right(key_frames, target) - 1
+            if previous >= 0 and key_frames[previous] > position:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, key_frames[previous])
+                position = key_frames[previous]
+
+        while position < target:
+            if not capture.grab():
+                return
+            position += 1
+
+        if not capture.grab():
+            return
+        position += 1
+
+        ret, frame = capture.retrieve()
+        if not ret:
+            return
+        yield target, frame
+
+
+def frame_signature(frame):
+    """
+    Cheap content descriptors of a frame, computed on a grayscale copy downscaled to
+    keyframe_score_width: the variance of its Laplacian, which drops with motion blur, and a 64-bit
+    difference hash, which barely changes between near-identical frames.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape[:2]
+    if width > keyframe_score_width:
+        gray = cv2.resize(gray, (keyframe_score_width, max(1, height * keyframe_score_width // width)),
+                          interpolation=cv2.INTER_AREA)
+
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    frame_hash = int.from_bytes(np.packbits(thumbnail[:, 1:] > thumbnail[:, :-1]).tobytes(), "big")
+    return sharpness, frame_hash
+
+
+def hash_distance(first, second):
+    return bin(first ^ second).count("1")
+
+
+def select_frames(frames, total_frames, num_frames):
+    """
+    Splits the video into num_frames equal segments and, from the (index, frame) candidates read in
+    each one, yields the sharpest frame that is not a near-duplicate of a frame already yielded.
+    Segments whose candidates all duplicate earlier picks yield nothing, so a stationary camera
+    costs a single inference. Only the running best frame of the current segment is held, except
+    when the container does not report its length (total_frames <= 0): then every candidate is
+    read first and the segments split the candidates actually read.
+    """
+    if total_frames <= 0:
+        frames = list(frames)
+
+    selected = []
+    best = None
+    segment = None
+    for position, (index, frame) in enumerate(frames):
+        if total_frames > 0:
+            frame_segment = min(index * num_frames // total_frames, num_frames - 1)
+        else:
+            frame_segment = position * num_frames // len(frames)
+        if frame_segment != segment:
+            if best is not None:
+                selected.append(best[1])
+                yield best[2], best[3]
+            best = None
+            segment = frame_segment
+
+        sharpness, frame_hash = frame_signature(frame)
+        if any(hash_distance(frame_hash, other) <= keyframe_duplicate_distance for other in selected):
+            continue
+        if best is None or sharpness > best[0]:
+            best = (sharpness, frame_hash, index, frame)
+
+    if best is not None:
+        yield best[2], best[3]
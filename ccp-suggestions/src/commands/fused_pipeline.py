@@ -0,0 +1,60 @@
+from os import getenv
+
+from src.commands.image_prediction import PredictionModel
+from src.commands.generate_recommendation import GenerateRecommendations
+from src.commands.send_email import SendEmail
+
+
+class FusedPipeline:
+    """
+    Runs prediction, recommendations and email in one process. The boxes detected in memory go
+    straight to the analyzers and the recommendations straight to the email builder, so neither the
+    two Pub/Sub hops nor the metadata downloads happen. Frames are still uploaded because the email
+    links to them.
+    """
+
+    def __init__(self, body):
+        self.prediction = PredictionModel(body)
+
+    @property
+    def stage(self):
+        return self.prediction.stage
+
+    @property
+    def timings(self):
+        return self.prediction.timings
+
+    def execute(self):
+        artifacts = self.prediction.cached_artifacts()
+        predictions = None
+        if artifacts is None:
+            predictions = self.prediction.predict_top_frames()
+            artifacts = self.prediction.upload_predictions(predictions)
+            self.prediction.cache_artifacts(artifacts)
+
+        with self.prediction.track_stage("recommendations"):
+            recommendations = GenerateRecommendations(
+                {'customer': self.prediction.customer, 'seller': self.prediction.seller, **artifacts}
+            )
+            if predictions is None:
+                # A cached prediction only has its uploaded detections
+                data = recommendations.download_metadata()
+            else:
+                data = [
+                    {"name": frame["image"], "boxes": prediction["box_set"]}
+                    for frame, prediction in zip(artifacts["message"], predictions)
+                ]
+            email = recommendations.analyze(data)
+
+        with self.prediction.track_stage("email"):
+            r = SendEmail(email).execute()
+
+        self.prediction.stage = "done"
+        return r
+
+
+def prediction_command():
+    # PIPELINE_MODE=fused runs every stage inside the container that received the video
+    if getenv('PIPELINE_MODE') == 'fused':
+        return FusedPipeline
+    return PredictionModel
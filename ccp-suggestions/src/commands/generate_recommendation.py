@@ -1,11 +1,11 @@
 import cv2
 import json
 import numpy as np
-import pandas as pd
-from google.cloud import storage
-from itertools import combinations
 
-from src.static.constants import bucket_name, bucket_image_folder, email_topic
+from src.static.constants import bucket_image_folder, email_topic, recommendations_load_images
+from src.commands.common.boxes import BoxSet
+from src.commands.common.gcs import download_many
+from src.commands.common.manifest import is_manifest, load_manifest
 from src.commands.common.pubsub import publish_message
 
 
@@ -13,42 +13,60 @@ class GenerateRecommendations:
     def __init__(self, body):
         self.body = body
         self.recommendations = []
-
-    def download_filtered_images(self):
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+        self.images = {}
+
+    def download_metadata(self):
+        if 'manifest' in self.body:
+            manifest = download_many([f"{bucket_image_folder}/{self.body['manifest']}"])[0]
+            # The format is told by the content, so a message that also lists per-frame JSON
+            # metadata still works when the manifest object is not a binary manifest
+            has_metadata = all('metadata' in img_set for img_set in self.body.get('message', [{}]))
+            if is_manifest(manifest) or not has_metadata:
+                return load_manifest(manifest)
+            print(f"{self.body['manifest']} is not a detection manifest, reading the per-frame metadata")
+
+        # Per-frame JSON metadata, as published before the binary manifest existed
+        names = [img_set['image'] for img_set in self.body['message']]
+        meta_names = [img_set['metadata'] for img_set in self.body['message']]
+        contents = download_many([f"{bucket_image_folder}/{meta_name}" for meta_name in meta_names])
 
         data = []
-        for img_set in self.body['message']:
-            img_name = img_set['image']
-            meta_name = img_set['metadata']
+        for img_name, json_bytes in zip(names, contents):
+            metadata = json.loads(json_bytes.decode("utf-8"))
+            data.append({"name": img_name, "boxes": BoxSet.from_records(metadata)})
 
-            img_blob = bucket.blob(f"{bucket_image_folder}/{img_name}")
-            meta_blob = bucket.blob(f"{bucket_image_folder}/{meta_name}")
+        return data
 
-            image_bytes = img_blob.download_as_bytes()
+    def load_image(self, name):
+        """
+        Downloads and decodes a frame the first time an analyzer asks for its pixels.
+        The box based analyzers never do, so by default no image is transferred.
+        """
+        if name not in self.images:
+            image_bytes = download_many([f"{bucket_image_folder}/{name}"])[0]
             np_arr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+            self.images[name] = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        return self.images[name]
 
-            json_bytes = meta_blob.download_as_bytes()
-            metadata = json.loads(json_bytes.decode("utf-8"))
+    def download_filtered_images(self):
+        data = self.download_metadata()
+        names = [image["name"] for image in data]
 
-            data.append({"name": img_name, "image": image, "metadata": metadata})
+        images_bytes = download_many([f"{bucket_image_folder}/{name}" for name in names])
+        for image, image_bytes in zip(data, images_bytes):
+            np_arr = np.frombuffer(image_bytes, np.uint8)
+            image["image"] = self.images[image["name"]] = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
 
         return data
 
-    def analyze_size_parity(self, metadata, name: int):
+    def analyze_size_parity(self, boxes: BoxSet, name: int):
         """
         This method gives a score for a set of criteria based on product density.
         A good density of products is based on distribution of the boxes and how many of them overlap between each other.
         The model is trained to recognize products on the front, so it shouldn't have much cluttering.
         """
-        df_metadata = pd.DataFrame(metadata)
-        df_metadata["length"] = df_metadata["x2"] - df_metadata["x1"]
-        df_metadata["height"] = df_metadata["y2"] - df_metadata["y1"]
-
-        mean_height = df_metadata["height"].mean()
-        var_height = df_metadata["height"].std()
+        mean_height = boxes.height.mean()
+        var_height = boxes.height.std(ddof=1)
         height_score = (mean_height - var_height) / (mean_height + var_height)
 
         if height_score >= 0.9:
@@ -64,8 +82,8 @@ class GenerateRecommendations:
                 {"name": name, "message": "La altura de los productos en su espacio es excesivamente diferente. Esto significa que los productos que está mostrando probablemente tienen propósitos distintos. Es muy importante mantener espacios homogéneos con productos similares para que sus clientes no tengan dificultades en encontrar lo que buscan"}
             )
 
-        mean_length = df_metadata["length"].mean()
-        var_length = df_metadata["length"].std()
+        mean_length = boxes.length.mean()
+        var_length = boxes.length.std(ddof=1)
         length_score = (mean_length - var_length) / (mean_length + var_length)
 
         if length_score >= 0.9:
@@ -81,24 +99,15 @@ class GenerateRecommendations:
                 {"name": name, "message": "El ancho de los productos es excesivamente diferente. Debe organizar sus espacios para que productos de tamaño y propósito similar se mantengan en posiciones cercanas. Es muy importante que los clientes no tengan la percepción de que los espacios están vacíos"}
             )
 
-    def analyze_spread(self, metadata, name: int):
+    def analyze_spread(self, boxes: BoxSet, name: int):
         """
         This method gives a score for a set of criteria based on product spread.
         A good density of products is based on distribution of the boxes and how much the total surface area of the products fill the
         actual area of the entire distribution of products. A good spread is expected to occupy near 95% of the total area. It also
         takes into account overlapping between products areas and what % the overlap represents
         """
-        df_metadata = pd.DataFrame(metadata)
-        df_metadata["length"] = df_metadata["x2"] - df_metadata["x1"]
-        df_metadata["height"] = df_metadata["y2"] - df_metadata["y1"]
-        df_metadata["area"] = df_metadata["height"] * df_metadata["length"]
-
-        max_x1 = df_metadata["x1"].min()
-        max_x2 = df_metadata["x2"].max()
-        max_y1 = df_metadata["y1"].min()
-        max_y2 = df_metadata["y2"].max()
-        total_spread_area = (max_x2 - max_x1) * (max_y2 - max_y1)
-        total_surface_area = df_metadata["area"].sum()
+        total_spread_area = boxes.spread_area
+        total_surface_area = boxes.area.sum()
 
         spread_score = total_surface_area / total_spread_area
         print(spread_score)
@@ -120,35 +129,13 @@ class GenerateRecommendations:
                 {"name": name, "message": "Tiene un exceso de productos en su espacio. Esto significa que sus productos están muy acumulados, provocando que el espacio tenga un efecto negativo sobre los clientes"}
             )
     
-    def calculate_overlapping_areas(self, metadata, name: int):
+    def calculate_overlapping_areas(self, boxes: BoxSet, name: int):
         """
         This method gives a score based on the percentage of overlap present in the image.
         The algorithm shouldn't detect a significant overlap as that means that the products are cluttered.
         A good distribution should be close to 0% of overlap
         """
-        df_metadata = pd.DataFrame(metadata)
-        df_metadata["length"] = df_metadata["x2"] - df_metadata["x1"]
-        df_metadata["height"] = df_metadata["y2"] - df_metadata["y1"]
-        df_metadata["area"] = df_metadata["height"] * df_metadata["length"]
-
-        max_x1 = df_metadata["x1"].min()
-        max_x2 = df_metadata["x2"].max()
-        max_y1 = df_metadata["y1"].min()
-        max_y2 = df_metadata["y2"].max()
-        total_spread_area = (max_x2 - max_x1) * (max_y2 - max_y1)
-
-        def compute_overlapping_area(rect1, rect2):
-            x_overlap = max(0, min(rect1['x2'], rect2['x2']) - max(rect1['x1'], rect2['x1']))
-            y_overlap = max(0, min(rect1['y2'], rect2['y2']) - max(rect1['y1'], rect2['y1']))
-            return x_overlap * y_overlap
-        
-        overlapped_areas = []
-        for i, j in combinations(df_metadata.index, 2):
-            area = compute_overlapping_area(df_metadata.loc[i], df_metadata.loc[j])
-            overlapped_areas.append(area)
-        
-        total_overlapping_area = sum(overlapped_areas)
-        overlapping_score = total_overlapping_area / total_spread_area
+        overlapping_score = boxes.overlapping_area / boxes.spread_area
         print(overlapping_score)
 
         if overlapping_score > 0.3:
@@ -164,18 +151,21 @@ class GenerateRecommendations:
                 {"name": name, "message": "Los productos se encuentran ordenados correctamente. Esto significa que sus espacios son agradables y que la busqueda de productos en su tienda es ágil y fácil de reemplazar"}
             )
 
-    def execute(self):
-        data = self.download_filtered_images()
+    def analyze(self, data):
         for image in data:
-            self.analyze_size_parity(image["metadata"], image['name'])
-            self.analyze_spread(image["metadata"], image['name'])
-            self.calculate_overlapping_areas(image["metadata"], image['name'])
-        
-        message = {
+            self.analyze_size_parity(image["boxes"], image['name'])
+            self.analyze_spread(image["boxes"], image['name'])
+            self.calculate_overlapping_areas(image["boxes"], image['name'])
+
+        return {
             "customer": self.body['customer'],
             "seller": self.body['seller'],
             "message": self.recommendations
         }
-        
+
+    def execute(self):
+        data = self.download_filtered_images() if recommendations_load_images else self.download_metadata()
+        message = self.analyze(data)
+
         r = publish_message(email_topic, message)
-        return {"response": r, "status_code": 200}
\ No newline at end of file
+        return {"response": r, "status_code": 200}
@@ -1,12 +1,52 @@
 import cv2
+import heapq
 import json
+import numpy as np
+from contextlib import contextmanager
 from datetime import datetime as dt
-from google.cloud import storage
 from io import BytesIO
-from ultralytics import YOLO
-
-from src.static.constants import model_path, bucket_name, bucket_image_folder, recommendations_topic
+from time import perf_counter
+
+from src.static.constants import (
+    bucket_image_folder, recommendations_topic, snap_keyframes, keyframe_candidates, inference_batch_size,
+    inference_batch_max_mb, detections_format, annotation_renderer, prediction_num_frames, prediction_top_frames
+)
+from src.commands.common import cache
+from src.commands.common.boxes import BoxSet
+from src.commands.common.gcs import upload_many
+from src.commands.common.manifest import build_manifest
+from src.commands.common.model_registry import get_model
 from src.commands.common.pubsub import publish_message
+from src.commands.common.video import read_frames, sample_indices, scan_key_frames, select_frames, snap_to_key_frames
+from src.yolov8.render import SpriteCache, draw_outlines
+
+box_color = (0, 255, 0)
+label_font = cv2.FONT_HERSHEY_SIMPLEX
+label_font_scale = 0.6
+label_font_thickness = 1
+
+
+def draw_label(image, x1, y1, label, color=box_color, text_color=(0, 0, 0)):
+    (label_width, label_height), _ = cv2.getTextSize(
+        label, label_font, label_font_scale, label_font_thickness
+    )
+
+    # Draw filled rectangle for label background
+    cv2.rectangle(
+        image,
+        (x1, y1 - label_height - 4),
+        (x1 + label_width, y1),
+        color,
+        -1,
+    )
+    # Put text label
+    cv2.putText(
+        image, label, (x1, y1 - 2), label_font, label_font_scale, text_color, label_font_thickness
+    )
+
+
+# Labels are "<class> <confidence:.2f>", so the same few hundred repeat across every frame
+label_sprites = SpriteCache(draw_label, label_font, label_font_scale, label_font_thickness)
 
 
 class PredictionModel:
@@ -17,83 +57,99 @@ class PredictionModel:
         self.blob_path = body['BlobPath']
         self.customer = body['Customer']
         self.seller = body['Seller']
-        self.model_path = model_path
-        self.model = self.model_initialization()
+        self.cache_key = None
+        self.stage = None
+        self.timings = {}
+        with self.track_stage("model"):
+            self.model = self.model_initialization()
+
+    @contextmanager
+    def track_stage(self, stage):
+        self.stage = stage
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = round(perf_counter() - start, 3)
 
     def model_initialization(self):
-        model = YOLO(self.model_path)
-        return model
+        return get_model()
 
-    def predict_keyframes(self, model, num_frames: int = 10):
+    def predict_keyframes(
+        self, model, num_frames: int = prediction_num_frames, top: int = prediction_top_frames,
+        snap: bool = snap_keyframes,
+        candidates: int = keyframe_candidates
+    ):
+        """
+        Samples the video and keeps only the `top` frames with the most detected boxes, ordered
+        from most to fewest boxes. Each of the `num_frames` segments of the video reads `candidates`
+        frames and only its sharpest one that is not a near-duplicate of an earlier pick reaches
+        the model. Frames are held raw in a bounded heap while sampling, and only the ones that
+        survive are annotated and encoded.
+        """
         capture = cv2.VideoCapture(self.blob_path)
         if not capture.isOpened():
             raise IOError(f"Failed to open video: {self.blob_path}")
 
         total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
-        step = max(1, total_frames // num_frames)
-
-        current = 0
-        processed = 0
-
-        predictions = []
-        while processed < num_frames and capture.isOpened():
-            capture.set(cv2.CAP_PROP_POS_FRAMES, current)
-            ret, frame = capture.read()
-            if not ret:
-                break
-
-            result = model(frame, save=False)
-            predictions.append(self.draw_predictions(result, frame))
-            current += step
-            processed += 1
+        indices = sample_indices(total_frames, num_frames * max(1, candidates))
+        key_frames = None
+        if snap:
+            key_frames = scan_key_frames(self.blob_path)
+            indices = snap_to_key_frames(indices, key_frames)
+
+        # Frames are run through the model in batches, bounded both by count and by the
+        # memory the decoded frames hold while they wait
+        max_batch_bytes = inference_batch_max_mb * 1024 * 1024
+        best = []
+        batch = []
+        batch_bytes = 0
+        frames = select_frames(read_frames(capture, indices, key_frames), total_frames, num_frames)
+        for sequence, (_, frame) in enumerate(frames):
+            batch.append((sequence, frame))
+            batch_bytes += frame.nbytes
+            if len(batch) >= inference_batch_size or batch_bytes >= max_batch_bytes:
+                self.keep_best(best, self.predict_batch(model, batch), top)
+                batch = []
+                batch_bytes = 0
+
+        if batch:
+            self.keep_best(best, self.predict_batch(model, batch), top)
 
         capture.release()
-        return predictions
-
-    def draw_predictions(self, result, image):
-        boxes = result[0].boxes
-        boxes_data = []
-        for box in boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            conf = float(box.conf[0])
-            cls = int(box.cls[0])
-            label = f"{self.model.names[cls]} {conf:.2f}"
-
-            boxes_data.append(
-                {
-                    "x1": x1,
-                    "y1": y1,
-                    "x2": x2,
-                    "y2": y2,
-                    "confidence": conf,
-                    "class_id": cls,
-                    "label": label,
-                }
-            )
-
-            # Draw rectangle with thinner line
-            cv2.rectangle(image, (x1, y1), (x2, y2), color=(0, 255, 0), thickness=1)
-
-            # Draw label with smaller font
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.6
-            font_thickness = 1
-            (label_width, label_height), _ = cv2.getTextSize(
-                label, font, font_scale, font_thickness
-            )
+        ranked = sorted(best, key=lambda entry: (-entry[0], -entry[1]))
+        return [self.draw_predictions(boxes, frame) for _, _, frame, boxes in ranked]
+
+    def keep_best(self, heap, predictions, top):
+        # Min-heap on (box count, -sequence): the weakest frame sits on top, and among ties the
+        # latest one is dropped first, as the stable sort this replaces would have done
+        for sequence, frame, boxes in predictions:
+            entry = (len(boxes), -sequence, frame, boxes)
+            if len(heap) < top:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    def predict_batch(self, model, batch):
+        results = model([frame for _, frame in batch], save=False)
+        return [
+            (sequence, frame, BoxSet.from_result(result, self.model.names))
+            for (sequence, frame), result in zip(batch, results)
+        ]
 
-            # Draw filled rectangle for label background
-            cv2.rectangle(
-                image,
-                (x1, y1 - label_height - 4),
-                (x1 + label_width, y1),
-                (0, 255, 0),
-                -1,
-            )
-            # Put text label
-            cv2.putText(
-                image, label, (x1, y1 - 2), font, font_scale, (0, 0, 0), font_thickness
-            )
+    def draw_predictions(self, boxes: BoxSet, image):
+        if annotation_renderer == "sprites":
+            # All outlines in one call, then every label copied from its pre-rendered sprite
+            draw_outlines(image, np.stack([boxes.x1, boxes.y1, boxes.x2, boxes.y2], axis=1), box_color, 1)
+            for x1, y1, label in zip(boxes.x1.tolist(), boxes.y1.tolist(), boxes.labels):
+                label_sprites.blit(image, x1, y1, label, box_color)
+        else:
+            for x1, y1, x2, y2, label in zip(
+                boxes.x1.tolist(), boxes.y1.tolist(), boxes.x2.tolist(), boxes.y2.tolist(), boxes.labels
+            ):
+                # Draw rectangle with thinner line
+                cv2.rectangle(image, (x1, y1), (x2, y2), color=box_color, thickness=1)
+                draw_label(image, x1, y1, label)
 
         success, encoded_image = cv2.imencode(".jpg", image)
         if not success:
@@ -103,32 +159,74 @@ class PredictionModel:
         return {
             "image": image_bytes,
             "boxes": len(boxes),
-            "boxes_data": json.dumps(boxes_data)
+            "box_set": boxes
         }
 
-    def execute(self):
-        predictions = self.predict_keyframes(self.model)
-        top_5_predictions = sorted(predictions, key=lambda x: x["boxes"], reverse=True)[
-            :5
-        ]
+    def predict_top_frames(self, top: int = prediction_top_frames):
+        with self.track_stage("inference"):
+            return self.predict_keyframes(self.model, top=top)
 
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+    def upload_predictions(self, predictions):
         now = dt.now().strftime("%Y-%m-%d_%H-%M-%S.%f")
 
-        message = []
-        
-        for index, image in enumerate(top_5_predictions):
-            blob = bucket.blob(f"{bucket_image_folder}/frame_{index}_{now}.jpg")
-            image["image"].seek(0)
-            blob.upload_from_file(image["image"], content_type="image/jpeg")
-            meta_blob = bucket.blob(f"{bucket_image_folder}/frame_metadata_{index}_{now}.json")
-            meta_blob.upload_from_string(image["boxes_data"], content_type="application/json")
-
-            message.append({
-                "image": f"frame_{index}_{now}.jpg",
-                "metadata": f"frame_metadata_{index}_{now}.json"
-            })
-        
-        r = publish_message(recommendations_topic, {'customer': self.customer, 'seller': self.seller, 'message': message})
-        return {"response": r, "status_code": 200}
\ No newline at end of file
+        artifacts = {"message": []}
+        uploads = []
+        for index, image in enumerate(predictions):
+            uploads.append((f"{bucket_image_folder}/frame_{index}_{now}.jpg", image["image"], "image/jpeg"))
+            frame = {"image": f"frame_{index}_{now}.jpg"}
+
+            if detections_format == "json":
+                frame["metadata"] = f"frame_metadata_{index}_{now}.json"
+                uploads.append((
+                    f"{bucket_image_folder}/{frame['metadata']}",
+                    json.dumps(image["box_set"].to_records()),
+                    "application/json"
+                ))
+
+            artifacts["message"].append(frame)
+
+        if detections_format == "manifest":
+            # One compact binary manifest holds the boxes of every frame of the job
+            artifacts["manifest"] = f"detections_{now}.ccpm"
+            manifest = build_manifest(
+                [(frame["image"], image["box_set"]) for frame, image in zip(artifacts["message"], predictions)],
+                self.model.names
+            )
+            uploads.append((f"{bucket_image_folder}/{artifacts['manifest']}", manifest, "application/octet-stream"))
+
+        with self.track_stage("upload"):
+            upload_many(uploads)
+        return artifacts
+
+    def cached_artifacts(self):
+        """
+        Returns the artifacts already published for this video and model, so a redelivered message
+        publishes them again instead of predicting and uploading a new set of frames.
+        """
+        with self.track_stage("cache"):
+            try:
+                self.cache_key = cache.prediction_key(self.blob_path, self.model.version)
+                return cache.lookup(self.cache_key)
+            except Exception as e:
+                # The cache only saves work, a failing tier never fails the prediction
+                print(f"Prediction cache lookup failed: {e}")
+                return None
+
+    def cache_artifacts(self, artifacts):
+        try:
+            cache.store(self.cache_key, artifacts)
+        except Exception as e:
+            print(f"Prediction cache store failed: {e}")
+
+    def execute(self):
+        artifacts = self.cached_artifacts()
+        if artifacts is None:
+            top_5_predictions = self.predict_top_frames()
+            artifacts = self.upload_predictions(top_5_predictions)
+            self.cache_artifacts(artifacts)
+
+        with self.track_stage("publish"):
+            r = publish_message(recommendations_topic, {'customer': self.customer, 'seller': self.seller, **artifacts})
+
+        self.stage = "done"
+        return {"response": r, "status_code": 200}
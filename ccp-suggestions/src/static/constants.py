@@ -5,3 +5,46 @@ bucket_name = "ccp-recommendations-videos"
 video_prediction_topic = "video-processing"
 recommendations_topic = "recommendations-generation"
 email_topic = "email-recommendations"
+model_versions_dir = "src/model"
+model_warmup_size = 640
+model_cache_max_versions = 2
+prediction_num_frames = 10
+prediction_top_frames = 5
+snap_keyframes = False
+keyframe_candidates = 4
+keyframe_score_width = 320
+keyframe_duplicate_distance = 6
+inference_batch_size = 10
+inference_batch_max_mb = 256
+storage_max_workers = 10
+storage_retry_deadline = 60
+recommendations_load_images = False
+pubsub_batch_max_messages = 100
+pubsub_batch_max_bytes = 1000000
+pubsub_batch_max_latency = 0.01
+pubsub_wait_for_publish = True
+video_subscription = "video-processing-sub"
+recommendations_subscription = "recommendations-generation-sub"
+email_subscription = "email-recommendations-sub"
+worker_threads = 4
+worker_max_messages = 4
+worker_max_bytes = 10485760
+worker_max_lease_duration = 3600
+jobs_max_workers = 1
+jobs_max_pending = 8
+jobs_history_size = 500
+detections_format = "manifest"
+annotation_renderer = "sprites"
+prediction_cache_enabled = True
+prediction_cache_dir = "/tmp/ccp-prediction-cache"
+prediction_cache_max_entries = 1000
+prediction_cache_gcs_prefix = None
+onnx_model_path = "src/model/bestv8.onnx"
+onnx_conf_threshold = 0.25
+onnx_iou_threshold = 0.7
+onnx_max_det = 300
+onnx_pre_nms_top_k = 30000
+onnx_tiled = False
+onnx_intra_op_threads = 0
+onnx_inter_op_threads = 0
+inference_backend = "ultralytics"
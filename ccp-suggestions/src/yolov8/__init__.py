@@ -0,0 +1 @@
+from .YOLOv8 import YOLOv8
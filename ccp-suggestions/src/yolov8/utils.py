@@ -0,0 +1,227 @@
+import numpy as np
+import cv2
+
+class_names = ['retail', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat', 'traffic light',
+               'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat', 'dog', 'horse', 'sheep', 'cow',
+               'elephant', 'bear', 'zebra', 'giraffe', 'backpack', 'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee',
+               'skis', 'snowboard', 'sports ball', 'kite', 'baseball bat', 'baseball glove', 'skateboard', 'surfboard',
+               'tennis racket', 'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple',
+               'sandwich', 'orange', 'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch',
+               'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse', 'remote', 'keyboard',
+               'cell phone', 'microwave', 'oven', 'toaster', 'sink', 'refrigerator', 'book', 'clock', 'vase',
+               'scissors', 'teddy bear', 'hair drier', 'toothbrush']
+
+# Create a list of colors for each class where each color is a tuple of 3 integer values
+rng = np.random.default_rng(3)
+colors = rng.uniform(0, 255, size=(len(class_names), 3))
+
+# Default of draw_detections: "sprites" (yolov8.render) or "opencv"
+annotation_renderer = "sprites"
+
+
+def nms(boxes, scores, iou_threshold, class_ids=None, max_det=None, backend="numpy"):
+    """
+    Greedy non-maximum suppression. Returns the indices of the kept boxes, highest score first.
+    With class_ids, boxes only suppress boxes of their own class. max_det caps the number of kept
+    boxes. The "opencv" backend runs cv2.dnn.NMSBoxes instead, which is faster but breaks score
+    ties and IoU == threshold cases slightly differently.
+    """
+    if class_ids is not None:
+        return batched_nms(boxes, scores, class_ids, iou_threshold, max_det, backend)
+
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if backend == "opencv":
+        xywh = np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+        # Candidates are already filtered by confidence, so the score threshold only has to let them through
+        keep = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), 0.0, iou_threshold)
+        return np.asarray(keep, dtype=np.int64).reshape(-1)[:max_det]
+
+    return blocked_nms(boxes, scores, iou_threshold, max_det)
+
+
+def blocked_nms(boxes, scores, iou_threshold, max_det=None, block_size=128):
+    # Same result as picking the best box and dropping its overlaps one at a time, but boxes are
+    # resolved in score-ordered blocks: the loop only runs inside a block, and the boxes kept there
+    # suppress the remaining later boxes in one vectorized step
+    order = np.argsort(scores)[::-1]
+    boxes = boxes[order]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    suppressed = np.zeros(len(order), dtype=bool)
+
+    keep_boxes = []
+    for start in range(0, len(order), block_size):
+        stop = min(start + block_size, len(order))
+        rows = start + np.flatnonzero(~suppressed[start:stop])
+        if rows.size == 0:
+            continue
+        later = stop + np.flatnonzero(~suppressed[stop:])
+        columns = np.concatenate([rows, later])
+
+        # Boxes are kept only while IoU < threshold, so a NaN IoU suppresses as it always did
+        overlaps = ~(iou_matrix(boxes[rows], areas[rows], boxes[columns], areas[columns]) < iou_threshold)
+
+        kept_rows = []
+        for row, box_id in enumerate(rows):
+            if suppressed[box_id]:
+                continue
+            keep_boxes.append(box_id)
+            if max_det is not None and len(keep_boxes) >= max_det:
+                return order[keep_boxes]
+            kept_rows.append(row)
+            suppressed[rows] |= overlaps[row, :len(rows)]
+
+        suppressed[later] |= overlaps[kept_rows, len(rows):].any(axis=0)
+
+    return order[keep_boxes]
+
+
+def batched_nms(boxes, scores, idxs, iou_threshold, max_det=None, backend="numpy"):
+    """
+    Runs NMS independently for every value of idxs (class ids, or image ids for a batch of images)
+    and merges the kept boxes by score.
+    """
+    keep_boxes = []
+    for idx in np.unique(idxs):
+        group = np.flatnonzero(idxs == idx)
+        keep_boxes.append(group[nms(boxes[group], scores[group], iou_threshold, max_det=max_det, backend=backend)])
+
+    if not keep_boxes:
+        return np.zeros(0, dtype=np.int64)
+
+    keep_boxes = np.concatenate(keep_boxes)
+    keep_boxes = keep_boxes[np.argsort(scores[keep_boxes], kind="stable")[::-1]]
+    return keep_boxes[:max_det]
+
+
+def iou_matrix(boxes_a, areas_a, boxes_b, areas_b):
+    # Pairwise IoU, evaluated with the same operations as compute_iou so results match it exactly
+    xmin = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    ymin = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    xmax = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    ymax = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+
+    intersection_area = np.maximum(0, xmax - xmin) * np.maximum(0, ymax - ymin)
+    union_area = areas_a[:, None] + areas_b[None, :] - intersection_area
+    return intersection_area / union_area
+
+
+def compute_iou(box, boxes):
+    # Compute xmin, ymin, xmax, ymax for both boxes
+    xmin = np.maximum(box[0], boxes[:, 0])
+    ymin = np.maximum(box[1], boxes[:, 1])
+    xmax = np.minimum(box[2], boxes[:, 2])
+    ymax = np.minimum(box[3], boxes[:, 3])
+
+    # Compute intersection area
+    intersection_area = np.maximum(0, xmax - xmin) * np.maximum(0, ymax - ymin)
+
+    # Compute union area
+    box_area = (box[2] - box[0]) * (box[3] - box[1])
+    boxes_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union_area = box_area + boxes_area - intersection_area
+
+    # Compute IoU
+    iou = intersection_area / union_area
+
+    return iou
+
+
+def xywh2xyxy(x, inplace=False):
+    # Convert bounding box (x, y, w, h) to bounding box (x1, y1, x2, y2)
+    if inplace:
+        half = x[..., 2:4] / 2
+        x[..., 2:4] = x[..., 0:2] + half
+        x[..., 0:2] -= half
+        return x
+
+    y = np.copy(x)
+    y[..., 0] = x[..., 0] - x[..., 2] / 2
+    y[..., 1] = x[..., 1] - x[..., 3] / 2
+    y[..., 2] = x[..., 0] + x[..., 2] / 2
+    y[..., 3] = x[..., 1] + x[..., 3] / 2
+    return y
+
+
+def draw_label(image, x1, y1, caption, color, size, text_thickness, text_color=(255, 255, 255)):
+    (tw, th), _ = cv2.getTextSize(text=caption, fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+                                  fontScale=size, thickness=text_thickness)
+    th = int(th * 1.2)
+
+    cv2.rectangle(image, (x1, y1),
+                  (x1 + tw, y1 - th), color, -1)
+    cv2.putText(image, caption, (x1, y1),
+                cv2.FONT_HERSHEY_SIMPLEX, size, text_color, text_thickness, cv2.LINE_AA)
+
+
+def draw_detections(image, boxes, scores, class_ids, mask_alpha=0.3, track_ids=None, renderer=None):
+    # "sprites" draws with yolov8.render, "opencv" with one OpenCV call per shape. The outputs are
+    # not byte-equal: sprites draws labels on top of every box, so they differ where boxes overlap
+    # labels, and the anti-aliased edges of the text can be off by a level or two
+    if (renderer or annotation_renderer) == "sprites":
+        from .render import render_detections
+        return render_detections(image, boxes, scores, class_ids, mask_alpha, track_ids)
+
+    mask_img = image.copy()
+    det_img = image.copy()
+
+    img_height, img_width = image.shape[:2]
+    size = min([img_height, img_width]) * 0.0006
+    text_thickness = int(min([img_height, img_width]) * 0.001)
+
+    if track_ids is None:
+        track_ids = [None] * len(scores)
+
+    # Draw bounding boxes and labels of detections
+    for box, score, class_id, track_id in zip(boxes, scores, class_ids, track_ids):
+        color = colors[class_id]
+
+        x1, y1, x2, y2 = box.astype(int)
+
+        # Draw rectangle
+        cv2.rectangle(det_img, (x1, y1), (x2, y2), color, 2)
+
+        # Draw fill rectangle in mask image
+        cv2.rectangle(mask_img, (x1, y1), (x2, y2), color, -1)
+
+        label = class_names[class_id]
+        caption = f'{label} {int(score * 100)}%' if track_id is None else f'{label} #{track_id} {int(score * 100)}%'
+        draw_label(det_img, x1, y1, caption, color, size, text_thickness)
+        draw_label(mask_img, x1, y1, caption, color, size, text_thickness)
+
+    return cv2.addWeighted(mask_img, mask_alpha, det_img, 1 - mask_alpha, 0)
+
+
+def draw_comparison(img1, img2, name1, name2, fontsize=2.6, text_thickness=3):
+    (tw, th), _ = cv2.getTextSize(text=name1, fontFace=cv2.FONT_HERSHEY_DUPLEX,
+                                  fontScale=fontsize, thickness=text_thickness)
+    x1 = img1.shape[1] // 3
+    y1 = th
+    offset = th // 5
+    cv2.rectangle(img1, (x1 - offset * 2, y1 + offset),
+                  (x1 + tw + offset * 2, y1 - th - offset), (0, 115, 255), -1)
+    cv2.putText(img1, name1,
+                (x1, y1),
+                cv2.FONT_HERSHEY_DUPLEX, fontsize,
+                (255, 255, 255), text_thickness)
+
+
+    (tw, th), _ = cv2.getTextSize(text=name2, fontFace=cv2.FONT_HERSHEY_DUPLEX,
+                                  fontScale=fontsize, thickness=text_thickness)
+    x1 = img2.shape[1] // 3
+    y1 = th
+    offset = th // 5
+    cv2.rectangle(img2, (x1 - offset * 2, y1 + offset),
+                  (x1 + tw + offset * 2, y1 - th - offset), (94, 23, 235), -1)
+
+    cv2.putText(img2, name2,
+                (x1, y1),
+                cv2.FONT_HERSHEY_DUPLEX, fontsize,
+                (255, 255, 255), text_thickness)
+
+    combined_img = cv2.hconcat([img1, img2])
+    if combined_img.shape[1] > 3840:
+        combined_img = cv2.resize(combined_img, (3840, 2160))
+
+    return combined_img
@@ -0,0 +1,30 @@
+from dotenv import load_dotenv
+from signal import signal, SIGTERM
+from sys import argv
+
+from src.commands.fused_pipeline import prediction_command
+from src.commands.generate_recommendation import GenerateRecommendations
+from src.commands.send_email import SendEmail
+from src.commands.common.model_registry import get_model
+from src.commands.common.subscriber import run_worker
+from src.static.constants import video_subscription, recommendations_subscription, email_subscription
+
+load_dotenv('.env')
+
+stages = {
+    "predict": (video_subscription, prediction_command()),
+    "recommendations": (recommendations_subscription, GenerateRecommendations),
+    "email": (email_subscription, SendEmail),
+}
+
+if __name__ == "__main__":
+    # python worker.py [predict] [recommendations] [email], all stages when none is given
+    selected = argv[1:] or list(stages)
+    if "predict" in selected:
+        get_model()
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    signal(SIGTERM, interrupt)
+    run_worker(dict(stages[stage] for stage in selected))
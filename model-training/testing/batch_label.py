@@ -0,0 +1,151 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+import onnxruntime
+
+from yolov8 import YOLOv8, VideoPipeline
+
+# Labels every video matched by the inputs with an ONNX model, spreading the videos over worker
+# processes that each hold their own session.
+#
+# python3 batch_label.py ../walkthroughs "more/*.mp4" --model models/best19.onnx --output labelled --workers 4
+#
+# Every video gets a labelled copy and a .jsonl sidecar with one line of detections per frame.
+# Both are written under temporary names and renamed once complete, so an interrupted run can be
+# started again and only labels the videos that are still missing.
+
+video_extensions = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+
+# The detector of each worker process, created once by init_worker
+detector = None
+
+
+def find_videos(inputs, output):
+    # The output tree is skipped, so an output directory inside an input directory is never
+    # labelled again, and neither are the .partial. files an interrupted run leaves behind
+    output = os.path.abspath(output)
+    videos = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*"), recursive=True)
+        else:
+            matches = glob.glob(item, recursive=True)
+        for path in matches:
+            path = os.path.abspath(path)
+            if not path.lower().endswith(video_extensions) or ".partial." in os.path.basename(path):
+                continue
+            if os.path.commonpath([path, output]) == output:
+                continue
+            videos.add(path)
+    return sorted(videos)
+
+
+def output_paths(video, root, output):
+    # Mirror the layout of the inputs under the output directory so equal file names do not collide
+    base = os.path.join(output, os.path.splitext(os.path.relpath(video, root))[0])
+    return f"{base}.mp4", f"{base}.jsonl"
+
+
+def is_complete(video_out, sidecar_out):
+    # The sidecar is renamed last, so both files existing means the video was fully labelled
+    return os.path.exists(video_out) and os.path.exists(sidecar_out)
+
+
+def init_worker(model_path, threads, conf_thres, iou_thres):
+    global detector
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    detector = YOLOv8(model_path, conf_thres=conf_thres, iou_thres=iou_thres,
+                      providers=['CPUExecutionProvider'], session_options=options)
+
+
+def label_video(video, video_out, sidecar_out):
+    os.makedirs(os.path.dirname(video_out), exist_ok=True)
+    video_tmp = f"{os.path.splitext(video_out)[0]}.partial.mp4"
+    sidecar_tmp = f"{sidecar_out}.partial"
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise IOError(f"Failed to open video: {video}")
+
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(video_tmp, fourcc, float(cap.get(cv2.CAP_PROP_FPS)), (frame_width, frame_height))
+
+    start = time.perf_counter()
+    try:
+        with open(sidecar_tmp, "w") as sidecar, VideoPipeline(cap, detector, writer=out) as pipeline:
+            for index, _, (boxes, scores, class_ids) in pipeline:
+                sidecar.write(json.dumps({
+                    "frame": index,
+                    "boxes": np.round(np.asarray(boxes, dtype=np.float64).reshape(-1, 4), 1).tolist(),
+                    "scores": np.round(np.asarray(scores, dtype=np.float64), 4).tolist(),
+                    "class_ids": np.asarray(class_ids, dtype=int).tolist(),
+                }) + "\n")
+    finally:
+        cap.release()
+        out.release()
+
+    os.replace(video_tmp, video_out)
+    os.replace(sidecar_tmp, sidecar_out)
+    return pipeline.frames, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="+", help="video files, directories or glob patterns")
+    parser.add_argument("--model", default="models/best19.onnx")
+    parser.add_argument("--output", default="labelled")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime threads per worker, 0 splits the cores evenly")
+    parser.add_argument("--conf-thres", type=float, default=0.35)
+    parser.add_argument("--iou-thres", type=float, default=0.5)
+    parser.add_argument("--overwrite", action="store_true", help="label videos again even if their outputs are complete")
+    args = parser.parse_args()
+
+    videos = find_videos(args.inputs, args.output)
+    if not videos:
+        print("No videos matched the inputs")
+        sys.exit(1)
+
+    root = os.path.commonpath([os.path.dirname(video) for video in videos])
+    jobs = {video: output_paths(video, root, args.output) for video in videos}
+    pending = {video: paths for video, paths in jobs.items() if args.overwrite or not is_complete(*paths)}
+    print(f"{len(videos)} videos, {len(videos) - len(pending)} already labelled, {len(pending)} to go")
+    if not pending:
+        return
+
+    workers = max(1, min(args.workers, len(pending)))
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+
+    failed = []
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(args.model, threads, args.conf_thres, args.iou_thres)) as executor:
+        futures = {executor.submit(label_video, video, *paths): video for video, paths in pending.items()}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                video = futures[future]
+                try:
+                    frames, seconds = future.result()
+                    print(f"[{done}/{len(futures)}] {video}: {frames} frames, {frames / max(seconds, 1e-9):.1f} fps")
+                except Exception as e:
+                    failed.append(video)
+                    print(f"[{done}/{len(futures)}] {video} failed: {e}")
+        except KeyboardInterrupt:
+            # Finished videos are already in place, the rest are picked up by the next run
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import time
+import numpy as np
+
+from yolov8.utils import compute_iou, nms
+
+# Compares the vectorized NMS in yolov8.utils against the original one-box-at-a-time loop on dense,
+# shelf-like candidate sets and checks both keep exactly the same boxes.
+#
+# python3 benchmark_nms.py --candidates 500 2000 8000
+
+
+def legacy_nms(boxes, scores, iou_threshold):
+    # The loop yolov8.utils.nms used before it was vectorized
+    sorted_indices = np.argsort(scores)[::-1]
+
+    keep_boxes = []
+    while sorted_indices.size > 0:
+        box_id = sorted_indices[0]
+        keep_boxes.append(box_id)
+        ious = compute_iou(boxes[box_id, :], boxes[sorted_indices[1:], :])
+        keep_indices = np.where(ious < iou_threshold)[0]
+        sorted_indices = sorted_indices[keep_indices + 1]
+
+    return keep_boxes
+
+
+def candidate_boxes(count, seed, classes=1, width=640, height=480):
+    # Products packed in rows, each proposed several times with jittered coordinates, like the raw
+    # output of a detector on a shelf before suppression
+    rng = np.random.default_rng(seed)
+    products = max(1, count // 8)
+    centers = rng.uniform([0, 0], [width, height], size=(products, 2))
+    sizes = rng.uniform(15, 60, size=(products, 2))
+    picks = rng.integers(0, products, count)
+
+    centers = centers[picks] + rng.normal(0, 3, size=(count, 2))
+    sizes = sizes[picks] * rng.uniform(0.85, 1.15, size=(count, 2))
+    boxes = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1).astype(np.float32)
+    scores = rng.uniform(0.25, 1.0, count).astype(np.float32)
+    class_ids = rng.integers(0, classes, count)
+    return boxes, scores, class_ids
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--iou-thres", type=float, default=0.5)
+    parser.add_argument("--classes", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'boxes':>6} {'kept':>6} {'legacy ms':>10} {'numpy ms':>9} {'opencv ms':>10} {'per-class ms':>13}")
+    for count in args.candidates:
+        boxes, scores, class_ids = candidate_boxes(count, args.seed, args.classes)
+
+        legacy, legacy_ms = timed(lambda: legacy_nms(boxes, scores, args.iou_thres), args.repeat)
+        vectorized, numpy_ms = timed(lambda: nms(boxes, scores, args.iou_thres), args.repeat)
+        _, opencv_ms = timed(lambda: nms(boxes, scores, args.iou_thres, backend="opencv"), args.repeat)
+        _, class_ms = timed(lambda: nms(boxes, scores, args.iou_thres, class_ids), args.repeat)
+
+        if not np.array_equal(np.asarray(legacy), vectorized):
+            raise AssertionError(f"vectorized NMS kept different boxes than the loop for {count} candidates")
+
+        print(f"{count:>6} {len(vectorized):>6} {legacy_ms:>10.2f} {numpy_ms:>9.2f} {opencv_ms:>10.2f} {class_ms:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
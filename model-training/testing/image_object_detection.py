@@ -4,7 +4,8 @@ from yolov8 import YOLOv8
 
 #Initialize yolov8
 model_path = "models/best18.onnx"
-yolov8_detector = YOLOv8(model_path, conf_thres=0.25, iou_thres=0.25)
+# Shelf photos are much larger than the model input, so they are detected in tiles at full resolution
+yolov8_detector = YOLOv8(model_path, conf_thres=0.25, iou_thres=0.25, tiled=True)
 
 #Read image
 # img_url = "https://media.newyorker.com/photos/5e5ed01f39e0e500082b73b6/master/w_2560%2Cc_limit/Rosner-CoronavirusPanicShopping.jpg"
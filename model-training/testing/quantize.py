@@ -0,0 +1,210 @@
+import argparse
+import os
+import random
+import sys
+import time
+import cv2
+import numpy as np
+import onnxruntime
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quantize_dynamic, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from yolov8 import YOLOv8
+from yolov8.utils import compute_iou
+
+# Exports FP32, dynamic INT8 and static (calibrated) INT8 ONNX models from a checkpoint and gates the
+# INT8 variants on mAP@0.5, latency and size against FP32 on a SKU110K subset.
+#
+# python3 quantize.py --weights models/best18.pt --data ../training/datasets/SKU-110K --budget 0.01
+#
+# --data is the SKU-110K root as laid out by ../training/custom.yaml: images/, labels/ (YOLO txt),
+# train.txt and val.txt. Calibration images come from train.txt and evaluation images from val.txt.
+
+
+def read_split(data, split, size, seed):
+    with open(os.path.join(data, f"{split}.txt")) as f:
+        images = [os.path.normpath(os.path.join(data, line.strip())) for line in f if line.strip()]
+    random.Random(seed).shuffle(images)
+    return images[:size]
+
+
+def read_labels(image_path, width, height):
+    label_path = os.path.splitext(image_path.replace(f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"))[0] + ".txt"
+    if not os.path.exists(label_path):
+        return np.zeros((0, 4)), np.zeros(0, dtype=int)
+
+    rows = np.loadtxt(label_path, ndmin=2)
+    class_ids = rows[:, 0].astype(int)
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return boxes, class_ids
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    # Feeds calibration images through the same preprocessing the detector uses at inference time
+    def __init__(self, detector, images):
+        self.detector = detector
+        self.images = iter(images)
+
+    def get_next(self):
+        image_path = next(self.images, None)
+        if image_path is None:
+            return None
+        tensor = self.detector.prepare_input(cv2.imread(image_path))
+        return {self.detector.input_names[0]: tensor.copy()}
+
+
+def average_precision(recall, precision):
+    # All-point interpolated area under the precision/recall curve
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    changes = np.where(recall[1:] != recall[:-1])[0]
+    return np.sum((recall[changes + 1] - recall[changes]) * precision[changes + 1])
+
+
+def mean_average_precision(detections, ground_truth, iou_threshold=0.5):
+    """
+    `detections` and `ground_truth` hold one (boxes, scores or None, class_ids) tuple per image.
+    Returns mAP@iou_threshold over the classes present in the ground truth.
+    """
+    classes = np.unique(np.concatenate([class_ids for _, _, class_ids in ground_truth]))
+    precisions = []
+    for class_id in classes:
+        scores, matches = [], []
+        total = 0
+        for (boxes, image_scores, class_ids), (truth, _, truth_ids) in zip(detections, ground_truth):
+            truth = truth[truth_ids == class_id]
+            total += len(truth)
+            selected = class_ids == class_id
+            boxes, image_scores = boxes[selected], image_scores[selected]
+
+            used = np.zeros(len(truth), dtype=bool)
+            for index in np.argsort(-image_scores):
+                matched = False
+                if len(truth):
+                    ious = compute_iou(boxes[index], truth)
+                    ious[used] = 0
+                    best = int(np.argmax(ious))
+                    if ious[best] >= iou_threshold:
+                        used[best] = matched = True
+                scores.append(image_scores[index])
+                matches.append(matched)
+
+        if total == 0:
+            continue
+        order = np.argsort(-np.array(scores))
+        true_positives = np.cumsum(np.array(matches, dtype=float)[order])
+        false_positives = np.cumsum(1 - np.array(matches, dtype=float)[order])
+        recall = true_positives / total
+        precision = true_positives / np.maximum(true_positives + false_positives, np.finfo(float).eps)
+        precisions.append(average_precision(recall, precision))
+
+    return float(np.mean(precisions)) if precisions else 0.0
+
+
+def evaluate(model_path, images, ground_truth, conf_thres, iou_thres, threads):
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    detector = YOLOv8(model_path, conf_thres=conf_thres, iou_thres=iou_thres,
+                      providers=['CPUExecutionProvider'], session_options=options)
+
+    # Warm up so session initialization does not count as latency
+    detector(cv2.imread(images[0]))
+
+    detections, latencies = [], []
+    for image_path in images:
+        image = cv2.imread(image_path)
+        start = time.perf_counter()
+        boxes, scores, class_ids = detector(image)
+        latencies.append((time.perf_counter() - start) * 1000)
+        detections.append((np.asarray(boxes).reshape(-1, 4), np.asarray(scores), np.asarray(class_ids, dtype=int)))
+
+    return {
+        "map50": mean_average_precision(detections, ground_truth),
+        "latency_ms": float(np.mean(latencies)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        "size_mb": os.path.getsize(model_path) / 1024 / 1024,
+    }
+
+
+def export_fp32(weights, imgsz):
+    if weights.endswith(".onnx"):
+        return weights
+
+    from ultralytics import YOLO
+    return YOLO(weights).export(format="onnx", imgsz=imgsz)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", default="models/best18.pt", help=".pt checkpoint or an already exported FP32 .onnx")
+    parser.add_argument("--data", default="../training/datasets/SKU-110K")
+    parser.add_argument("--imgsz", type=int, nargs=2, default=[480, 640])
+    parser.add_argument("--calibration-size", type=int, default=200)
+    parser.add_argument("--eval-size", type=int, default=100)
+    parser.add_argument("--budget", type=float, default=0.01, help="largest mAP@0.5 drop accepted against FP32")
+    parser.add_argument("--variants", nargs="+", default=["dynamic", "static"], choices=["dynamic", "static"])
+    parser.add_argument("--conf-thres", type=float, default=0.25)
+    parser.add_argument("--iou-thres", type=float, default=0.5)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--keep-rejected", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fp32_path = export_fp32(args.weights, args.imgsz)
+    base = os.path.splitext(fp32_path)[0]
+    models = {"fp32": fp32_path}
+
+    # Shape inference and graph optimization give the quantizer a cleaner graph to work with
+    prepared_path = f"{base}-prepared.onnx"
+    quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+
+    if "dynamic" in args.variants:
+        models["dynamic"] = f"{base}-int8-dynamic.onnx"
+        quantize_dynamic(prepared_path, models["dynamic"], weight_type=QuantType.QInt8)
+
+    if "static" in args.variants:
+        models["static"] = f"{base}-int8-static.onnx"
+        reference = YOLOv8(fp32_path, providers=['CPUExecutionProvider'])
+        calibration = read_split(args.data, "train", args.calibration_size, args.seed)
+        quantize_static(prepared_path, models["static"], ImageCalibrationReader(reference, calibration),
+                        quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        calibrate_method=CalibrationMethod.MinMax)
+
+    os.remove(prepared_path)
+
+    images = read_split(args.data, "val", args.eval_size, args.seed)
+    ground_truth = []
+    for image_path in images:
+        height, width = cv2.imread(image_path).shape[:2]
+        boxes, class_ids = read_labels(image_path, width, height)
+        ground_truth.append((boxes, None, class_ids))
+
+    results = {name: evaluate(path, images, ground_truth, args.conf_thres, args.iou_thres, args.threads)
+               for name, path in models.items()}
+
+    reference = results["fp32"]
+    rejected = []
+    print(f"{'model':<8} {'mAP50':>7} {'delta':>7} {'ms/img':>8} {'p95 ms':>8} {'MB':>7}")
+    for name, result in results.items():
+        delta = result["map50"] - reference["map50"]
+        status = ""
+        if name != "fp32" and -delta > args.budget:
+            status = "REJECTED"
+            rejected.append(name)
+        print(f"{name:<8} {result['map50']:7.4f} {delta:+7.4f} {result['latency_ms']:8.1f} "
+              f"{result['latency_p95_ms']:8.1f} {result['size_mb']:7.1f} {status}")
+
+    for name in rejected:
+        if not args.keep_rejected:
+            os.remove(models[name])
+        print(f"{models[name]} lost more than {args.budget:.4f} mAP@0.5")
+
+    sys.exit(1 if rejected else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 import cv2
 # from cap_from_youtube import cap_from_youtube
-from yolov8 import YOLOv8
+from yolov8 import YOLOv8, VideoPipeline
 
 #MUST USE: python3 -m pip install protobuf==3.20.3
 
@@ -22,27 +22,17 @@ model_path = "models/best19.onnx"
 yolov8_detector = YOLOv8(model_path, conf_thres=0.35, iou_thres=0.5)
 
 cv2.namedWindow("Detected Objects", cv2.WINDOW_NORMAL)
-while cap.isOpened():
 
-    try:
-        #Read frame from the video
-        ret, frame = cap.read()
-        if not ret:
-            break
-    except Exception as e:
-        print(e)
-        continue
-
-    boxes, scores, class_ids = yolov8_detector(frame)
+# Decoding, inference and drawing/writing run on their own threads, the window stays on this one
+with VideoPipeline(cap, yolov8_detector, writer=out) as pipeline:
+    for index, combined_img, (boxes, scores, class_ids) in pipeline:
+        cv2.imshow("Detected Objects", combined_img)
 
-    combined_img = yolov8_detector.draw_detections(frame)
-    cv2.imshow("Detected Objects", combined_img)
+        c = cv2.waitKey(1)
+        if c & 0xFF == ord('q'):
+            break
 
-    out.write(combined_img)
-    
-    c = cv2.waitKey(1)
-    if c & 0xFF == ord('q'):
-        break
+print(pipeline.summary())
 
 cap.release()
 out.release()
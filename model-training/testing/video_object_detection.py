@@ -1,6 +1,6 @@
 import cv2
 from cap_from_youtube import cap_from_youtube
-from yolov8 import YOLOv8
+from yolov8 import YOLOv8, YOLOv8Tracker, VideoPipeline
 
 #MUST USE: python3 -m pip install protobuf==3.20.3
 
@@ -15,23 +15,19 @@ cap.set(cv2.CAP_PROP_POS_FRAMES, start_time * cap.get(cv2.CAP_PROP_FPS))
 model_path = "models/best18.onnx"
 yolov8_detector = YOLOv8(model_path, conf_thres=0.5, iou_thres=0.5)
 
+# Detect every 5 frames (or on a scene change) and track the boxes in between
+yolov8_tracker = YOLOv8Tracker(yolov8_detector, detect_every=5)
+
 cv2.namedWindow("Detected Objects", cv2.WINDOW_NORMAL)
-while cap.isOpened():
 
-    #Press key q to stop
-    if cv2.waitKey(1) == ord('q'):
-        break
+# Decoding, inference and drawing run on their own threads, the window stays on this one
+with VideoPipeline(cap, yolov8_tracker) as pipeline:
+    for index, combined_img, (boxes, scores, class_ids, track_ids) in pipeline:
+        cv2.imshow("Detected Objects", combined_img)
 
-    try:
-        #Read frame from the video
-        ret, frame = cap.read()
-        if not ret:
+        #Press key q to stop
+        if cv2.waitKey(1) == ord('q'):
             break
-    except Exception as e:
-        print(e)
-        continue
-
-    boxes, scores, class_ids = yolov8_detector(frame)
 
-    combined_img = yolov8_detector.draw_detections(frame)
-    cv2.imshow("Detected Objects", combined_img)
\ No newline at end of file
+print(pipeline.summary())
+print(f"{yolov8_tracker.detections} detections, {yolov8_tracker.count} products tracked")
@@ -1,5 +1,5 @@
 import cv2
-from yolov8 import YOLOv8
+from yolov8 import YOLOv8, YOLOv8Tracker
 
 #Initialize the webcam
 cap = cv2.VideoCapture(0)
@@ -8,6 +8,9 @@ cap = cv2.VideoCapture(0)
 model_path = "models/best.onnx"
 yolov8_detector = YOLOv8(model_path, conf_thres=0.5, iou_thres=0.5)
 
+# Detect every 5 frames (or on a scene change) and track the boxes in between
+yolov8_tracker = YOLOv8Tracker(yolov8_detector, detect_every=5)
+
 cv2.namedWindow("Detected Objects", cv2.WINDOW_NORMAL)
 while cap.isOpened():
 
@@ -17,9 +20,9 @@ while cap.isOpened():
     if not ret:
         break
 
-    boxes, scores, class_ids = yolov8_detector(frame)
+    boxes, scores, class_ids, track_ids = yolov8_tracker(frame)
 
-    combined_img = yolov8_detector.draw_detections(frame)
+    combined_img = yolov8_tracker.draw_detections(frame)
     cv2.imshow("Detected Objects", combined_img)
 
     #Press key q to stop
@@ -3,25 +3,50 @@ import cv2
 import numpy as np
 import onnxruntime
 
-from yolov8.utils import xywh2xyxy, nms, draw_detections
+from .utils import xywh2xyxy, nms, draw_detections
+
+
+# Distance in input pixels from an inner tile border within which a box counts as cut by the tile
+tile_margin = 2
+
+
+def tile_starts(length, tile, overlap):
+    # Evenly spread start offsets of tiles that cover length with at least the given overlap
+    if length <= tile:
+        return [0]
+    count = int(np.ceil((length - tile) / (tile * (1 - overlap)))) + 1
+    return np.linspace(0, length - tile, count).round().astype(int).tolist()
 
 
 class YOLOv8:
 
-    def __init__(self, path, conf_thres=0.7, iou_thres=0.5):
+    def __init__(self, path, conf_thres=0.7, iou_thres=0.5, providers=None, session_options=None, letterbox=False,
+                 class_aware=False, max_det=None, pre_nms_top_k=None, tiled=False, tile_overlap=0.2, tile_scale=1.0,
+                 tile_full_frame=True):
         self.conf_threshold = conf_thres
         self.iou_threshold = iou_thres
+        self.letterbox = letterbox
+        self.class_aware = class_aware
+        self.max_det = max_det
+        self.pre_nms_top_k = pre_nms_top_k
+        self.tiled = tiled
+        self.tile_overlap = tile_overlap
+        self.tile_scale = tile_scale
+        self.tile_full_frame = tile_full_frame
 
         # Initialize model
-        self.initialize_model(path)
+        self.initialize_model(path, providers, session_options)
 
     def __call__(self, image):
+        if self.tiled:
+            return self.detect_tiled(image)
         return self.detect_objects(image)
 
-    def initialize_model(self, path):
+    def initialize_model(self, path, providers=None, session_options=None):
         self.session = onnxruntime.InferenceSession(path,
-                                                    providers=['DmlExecutionProvider',
-                                                               'CPUExecutionProvider'])
+                                                    sess_options=session_options,
+                                                    providers=providers or ['DmlExecutionProvider',
+                                                                            'CPUExecutionProvider'])
         # Get model info
         self.get_input_details()
         self.get_output_details()
@@ -37,21 +62,117 @@ class YOLOv8:
 
         return self.boxes, self.scores, self.class_ids
 
+    def detect_tiled(self, image):
+        """
+        Sliced inference for frames much larger than the model input. The frame is covered with
+        tiles of tile_scale times the input size that overlap by tile_overlap, each tile is resized
+        to the input (not at all with the default scale of 1), and all tiles run as one batch when
+        the model has a dynamic batch dimension, one by one otherwise. Tile detections cut by an
+        inner tile border are dropped, the rest are mapped back to frame coordinates and merged
+        with the detections of the whole downscaled frame, which catch objects larger than the
+        overlap, by class-aware NMS.
+        """
+        img_height, img_width = image.shape[:2]
+        tile_width = round(self.input_width * self.tile_scale)
+        tile_height = round(self.input_height * self.tile_scale)
+        origins = [(x, y)
+                   for y in tile_starts(img_height, tile_height, self.tile_overlap)
+                   for x in tile_starts(img_width, tile_width, self.tile_overlap)]
+
+        # Tiles cut short by the frame border are padded with the same gray as the letterbox
+        batch = np.full((len(origins), 3, self.input_height, self.input_width), 114 / 255.0, dtype=np.float32)
+        for tensor, (x, y) in zip(batch, origins):
+            tile = image[y:y + tile_height, x:x + tile_width]
+            if self.tile_scale != 1.0:
+                tile = cv2.resize(tile, (round(tile.shape[1] / self.tile_scale), round(tile.shape[0] / self.tile_scale)))
+            tile_rows, tile_columns = min(tile.shape[0], self.input_height), min(tile.shape[1], self.input_width)
+            for channel in range(3):
+                np.divide(tile[:tile_rows, :tile_columns, 2 - channel], np.float32(255.0),
+                          out=tensor[channel, :tile_rows, :tile_columns], dtype=np.float32)
+
+        if self.dynamic_batch:
+            outputs = self.inference(batch)[0]
+        else:
+            outputs = np.concatenate([self.inference(batch[index:index + 1])[0] for index in range(len(batch))])
+
+        all_boxes, all_scores, all_class_ids = [], [], []
+        for predictions, (x, y) in zip(outputs, origins):
+            selected = self.select_candidates(predictions)
+            if selected is None:
+                continue
+            boxes, scores, class_ids = selected
+            boxes = xywh2xyxy(boxes, inplace=True)
+
+            # Boxes touching a tile border inside the frame are objects cut by the tile. The
+            # overlapping neighbour sees them whole, so the fragments are dropped before merging
+            cut = np.zeros(len(boxes), dtype=bool)
+            if x > 0:
+                cut |= boxes[:, 0] <= tile_margin
+            if y > 0:
+                cut |= boxes[:, 1] <= tile_margin
+            if x + tile_width < img_width:
+                cut |= boxes[:, 2] >= self.input_width - tile_margin
+            if y + tile_height < img_height:
+                cut |= boxes[:, 3] >= self.input_height - tile_margin
+            boxes, scores, class_ids = boxes[~cut], scores[~cut], class_ids[~cut]
+
+            boxes *= self.tile_scale
+            boxes[:, 0::2] += x
+            boxes[:, 1::2] += y
+            all_boxes.append(boxes)
+            all_scores.append(scores)
+            all_class_ids.append(class_ids)
+
+        if self.tile_full_frame:
+            boxes, scores, class_ids = self.detect_objects(image)
+            if len(scores):
+                all_boxes.append(boxes)
+                all_scores.append(scores)
+                all_class_ids.append(class_ids)
+
+        if not all_scores:
+            self.boxes, self.scores, self.class_ids = [], [], []
+            return self.boxes, self.scores, self.class_ids
+
+        boxes = np.concatenate(all_boxes).astype(np.float32, copy=False)
+        scores = np.concatenate(all_scores)
+        class_ids = np.concatenate(all_class_ids)
+
+        # Cross-tile NMS removes the copies of objects seen by several tiles
+        indices = nms(boxes, scores, self.iou_threshold, class_ids, self.max_det)
+
+        self.boxes, self.scores, self.class_ids = boxes[indices], scores[indices], class_ids[indices]
+        return self.boxes, self.scores, self.class_ids
+
     def prepare_input(self, image):
         self.img_height, self.img_width = image.shape[:2]
 
-        input_img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        # Resize input image
-        input_img = cv2.resize(input_img, (self.input_width, self.input_height))
-
-        # Scale input pixel values to 0 to 1
-        input_img = input_img / 255.0
-        input_img = input_img.transpose(2, 0, 1)
-        input_tensor = input_img[np.newaxis, :, :, :].astype(np.float32)
-
-        return input_tensor
-
+        if self.letterbox:
+            # Keep the aspect ratio and center the resized image on a gray canvas
+            self.scale = min(self.input_width / self.img_width, self.input_height / self.img_height)
+            resized_width = round(self.img_width * self.scale)
+            resized_height = round(self.img_height * self.scale)
+            self.pad = ((self.input_width - resized_width) // 2, (self.input_height - resized_height) // 2)
+        else:
+            resized_width, resized_height = self.input_width, self.input_height
+            self.pad = (0, 0)
+
+        # The input buffers are allocated once per session and only rebuilt when the geometry changes
+        geometry = (resized_width, resized_height, self.pad)
+        if geometry != self.input_geometry:
+            self.resized_buffer = np.empty((resized_height, resized_width, 3), dtype=np.uint8)
+            self.input_tensor.fill(114 / 255.0)
+            self.input_geometry = geometry
+
+        cv2.resize(image, (resized_width, resized_height), dst=self.resized_buffer)
+
+        # BGR to RGB, scaling to 0-1 and HWC to CHW in one pass per channel, written straight into the input tensor
+        pad_x, pad_y = self.pad
+        target = self.input_tensor[0, :, pad_y:pad_y + resized_height, pad_x:pad_x + resized_width]
+        for channel in range(3):
+            np.divide(self.resized_buffer[:, :, 2 - channel], np.float32(255.0), out=target[channel], dtype=np.float32)
+
+        return self.input_tensor
 
     def inference(self, input_tensor):
         start = time.perf_counter()
@@ -61,27 +182,52 @@ class YOLOv8:
         return outputs
 
     def process_output(self, output):
-        predictions = np.squeeze(output[0]).T
-
-        # Filter out object confidence scores below threshold
-        scores = np.max(predictions[:, 4:], axis=1)
-        predictions = predictions[scores > self.conf_threshold, :]
-        scores = scores[scores > self.conf_threshold]
+        selected = self.select_candidates(output[0][0])
 
-        if len(scores) == 0:
+        if selected is None:
             return [], [], []
-
-        # Get the class with the highest confidence
-        class_ids = np.argmax(predictions[:, 4:], axis=1)
+        boxes, scores, class_ids = selected
 
         # Get bounding boxes for each object
-        boxes = self.extract_boxes(predictions)
+        boxes = self.extract_boxes(boxes)
 
         # Apply non-maxima suppression to suppress weak, overlapping bounding boxes
-        indices = nms(boxes, scores, self.iou_threshold)
+        indices = nms(boxes, scores, self.iou_threshold,
+                      class_ids if self.class_aware else None, self.max_det)
 
         return boxes[indices], scores[indices], class_ids[indices]
 
+    def select_candidates(self, predictions):
+        """
+        Filters one image of raw output, laid out as (4 + classes, anchors), on that layout so only
+        the survivors are ever transposed. Returns their xywh boxes in input pixels, scores and
+        class ids, or None when nothing passes the confidence threshold.
+        """
+        class_scores = predictions[4:]
+
+        # Filter out object confidence scores below threshold. The max over classes runs on the
+        # contiguous class rows, which is far cheaper than an argmax over every anchor
+        scores = class_scores[0] if len(class_scores) == 1 else np.max(class_scores, axis=0)
+        candidates = np.flatnonzero(scores > self.conf_threshold)
+
+        if len(candidates) == 0:
+            return None
+
+        # Keep only the best pre_nms_top_k candidates, still in anchor order, before NMS
+        if self.pre_nms_top_k is not None and len(candidates) > self.pre_nms_top_k:
+            best = np.argpartition(scores[candidates], -self.pre_nms_top_k)[-self.pre_nms_top_k:]
+            candidates = np.sort(candidates[best])
+
+        scores = scores[candidates]
+
+        # Get the class with the highest confidence, only for the surviving candidates
+        if len(class_scores) == 1:
+            class_ids = np.zeros(len(candidates), dtype=np.int64)
+        else:
+            class_ids = np.argmax(class_scores.T[candidates], axis=1)
+
+        return predictions[:4, candidates].T, scores, class_ids
+
     def extract_boxes(self, predictions):
         # Extract boxes from predictions
         boxes = predictions[:, :4]
@@ -89,13 +235,21 @@ class YOLOv8:
         # Scale boxes to original image dimensions
         boxes = self.rescale_boxes(boxes)
 
-        # Convert boxes to xyxy format
-        boxes = xywh2xyxy(boxes)
+        # Convert boxes to xyxy format, rescaling already produced a new array
+        boxes = xywh2xyxy(boxes, inplace=True)
 
         return boxes
 
     def rescale_boxes(self, boxes):
 
+        if self.letterbox:
+            # Undo the letterbox: remove the padding from the centers, then undo the uniform scale
+            boxes = boxes.astype(np.float32)
+            boxes[:, 0] -= self.pad[0]
+            boxes[:, 1] -= self.pad[1]
+            boxes /= self.scale
+            return boxes
+
         # Rescale boxes to original image dimensions
         input_shape = np.array([self.input_width, self.input_height, self.input_width, self.input_height])
         boxes = np.divide(boxes, input_shape, dtype=np.float32)
@@ -114,6 +268,11 @@ class YOLOv8:
         self.input_shape = model_inputs[0].shape
         self.input_height = self.input_shape[2]
         self.input_width = self.input_shape[3]
+        # Exports with dynamic=True name the batch dimension instead of fixing it to 1
+        self.dynamic_batch = not isinstance(self.input_shape[0], int) or self.input_shape[0] < 1
+
+        self.input_tensor = np.empty((1, 3, self.input_height, self.input_width), dtype=np.float32)
+        self.input_geometry = None
 
     def get_output_details(self):
         model_outputs = self.session.get_outputs()
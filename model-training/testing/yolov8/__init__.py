@@ -1 +1,3 @@
 from .YOLOv8 import YOLOv8
+from .pipeline import VideoPipeline
+from .tracker import YOLOv8Tracker
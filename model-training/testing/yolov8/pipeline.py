@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+
+from .utils import draw_detections
+
+# Marks the end of the stream on a stage queue
+_END = object()
+
+
+class StageCounter:
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+
+    def add(self, seconds):
+        self.frames += 1
+        self.busy += seconds
+
+    @property
+    def fps(self):
+        # Frames per second of busy time, the rate this stage could sustain on its own
+        return self.frames / self.busy if self.busy else 0.0
+
+
+class VideoPipeline:
+    """
+    Decodes, detects and draws/encodes a video on three threads joined by bounded queues, so a clip
+    is labelled at the speed of the slowest stage instead of the sum of all of them. Every stage is
+    a single thread, so frames come out in decode order.
+
+    Iterating yields (index, annotated frame, detections) on the calling thread, where detections
+    is whatever the detector returns: (boxes, scores, class_ids), plus track_ids for a tracker.
+    That keeps cv2.imshow and cv2.waitKey on the main thread. Use it as a context manager so the
+    threads stop when the loop is left early.
+    """
+
+    def __init__(self, capture, detector, writer=None, queue_size=8, mask_alpha=0.4):
+        self.capture = capture
+        self.detector = detector
+        self.writer = writer
+        self.mask_alpha = mask_alpha
+
+        self.counters = {name: StageCounter(name) for name in ("decode", "inference", "encode")}
+        self.decoded = queue.Queue(queue_size)
+        self.detected = queue.Queue(queue_size)
+        self.encoded = queue.Queue(queue_size)
+        self.stopped = threading.Event()
+        self.error = None
+        self.frames = 0
+        self.started = None
+        self.finished = None
+
+        self.threads = [
+            threading.Thread(target=self.decode, daemon=True),
+            threading.Thread(target=self.stage, args=("inference", self.decoded, self.detected, self.infer), daemon=True),
+            threading.Thread(target=self.stage, args=("encode", self.detected, self.encoded, self.encode), daemon=True),
+        ]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        self.join()
+
+    def __iter__(self):
+        self.start()
+        while True:
+            item = self.get(self.encoded)
+            if item is _END:
+                break
+            self.frames += 1
+            yield item
+
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def start(self):
+        if self.started is None:
+            self.started = time.perf_counter()
+            for thread in self.threads:
+                thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    def put(self, stage_queue, item):
+        # Blocks while the next stage is behind, but gives up once the pipeline is stopped
+        while not self.stopped.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, stage_queue):
+        while not self.stopped.is_set():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def decode(self):
+        counter = self.counters["decode"]
+        index = 0
+        try:
+            while self.capture.isOpened():
+                start = time.perf_counter()
+                try:
+                    #Read frame from the video
+                    ret, frame = self.capture.read()
+                    if not ret:
+                        break
+                except Exception as e:
+                    print(e)
+                    continue
+                counter.add(time.perf_counter() - start)
+
+                if not self.put(self.decoded, (index, frame)):
+                    return
+                index += 1
+        except Exception as e:
+            self.error = e
+            self.stop()
+        finally:
+            self.put(self.decoded, _END)
+
+    def stage(self, name, source, sink, work):
+        counter = self.counters[name]
+        try:
+            while True:
+                item = self.get(source)
+                if item is _END:
+                    break
+
+                start = time.perf_counter()
+                result = work(*item)
+                counter.add(time.perf_counter() - start)
+
+                if not self.put(sink, result):
+                    return
+        except Exception as e:
+            # Stop the other stages, the error is raised again on the iterating thread
+            self.error = e
+            self.stop()
+        finally:
+            self.put(sink, _END)
+
+    def infer(self, index, frame):
+        return index, frame, self.detector(frame)
+
+    def encode(self, index, frame, detections):
+        # A YOLOv8Tracker also returns the track ids, which are drawn next to the labels
+        boxes, scores, class_ids, *track_ids = detections
+        combined_img = draw_detections(frame, boxes, scores, class_ids, self.mask_alpha, *track_ids)
+        if self.writer is not None:
+            self.writer.write(combined_img)
+        return index, combined_img, detections
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        stages = " | ".join(f"{counter.name} {counter.fps:.1f} fps" for counter in self.counters.values())
+        overall = self.frames / elapsed if elapsed > 0 else 0.0
+        return f"{stages} | overall {overall:.1f} fps over {self.frames} frames"
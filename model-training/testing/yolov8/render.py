@@ -0,0 +1,195 @@
+import cv2
+import numpy as np
+
+from .utils import class_names, colors, draw_label
+
+
+class SpriteCache:
+    """
+    Pre-rendered labels. draw_label(canvas, x, y, caption, color, text_color=...) makes the same
+    OpenCV calls a renderer makes for the label of a box whose top-left corner is (x, y). It runs
+    once per distinct caption and color, on a blank canvas, so every later label is a copy of the
+    opaque block behind the text plus the few anti-aliased pixels around it. Captions carry a
+    rounded confidence, so a frame with hundreds of boxes mostly hits the cache.
+    """
+
+    def __init__(self, draw_label, font, font_scale, thickness, max_sprites=4096):
+        self.draw_label = draw_label
+        self.font = font
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.max_sprites = max_sprites
+        self.sprites = {}
+
+    def sprite(self, caption, color):
+        key = (caption, color)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            if len(self.sprites) >= self.max_sprites:
+                self.sprites.clear()
+            sprite = self.sprites[key] = self.render(caption, color)
+        return sprite
+
+    def render(self, caption, color):
+        (text_width, text_height), baseline = cv2.getTextSize(caption, self.font, self.font_scale, self.thickness)
+        margin = 8 + 2 * max(self.thickness, 1)
+        x, y = margin, margin + 2 * text_height
+        height, width = y + text_height + baseline + margin, text_width + 2 * margin
+
+        # The label is drawn in its colors and in white, both on black. The white copy tells how much
+        # of every pixel the label covers, so its anti-aliased edges can be blended over any frame
+        patch = np.zeros((height, width, 3), dtype=np.uint8)
+        self.draw_label(patch, x, y, caption, color)
+        coverage = np.zeros((height, width, 3), dtype=np.uint8)
+        self.draw_label(coverage, x, y, caption, (255, 255, 255), text_color=(255, 255, 255))
+        coverage = coverage[:, :, 0]
+
+        opaque = coverage == 255
+        top, bottom, left, right = _extent(opaque)
+        if not opaque[top:bottom, left:right].all():
+            top = bottom = left = right = 0
+        block = patch[top:bottom, left:right].copy()
+
+        # What the block leaves out, usually a thin strip of anti-aliased pixels, is blended. It is
+        # kept premultiplied since the patch was drawn on black
+        fringe = coverage > 0
+        fringe[top:bottom, left:right] = False
+        fringe_top, fringe_bottom, fringe_left, fringe_right = _extent(fringe)
+        values = patch[fringe_top:fringe_bottom, fringe_left:fringe_right].astype(np.float32)
+        transparency = 1.0 - coverage[fringe_top:fringe_bottom, fringe_left:fringe_right, None] / np.float32(255.0)
+        # Block pixels inside the strip keep their place, the block is copied over them
+        values[fringe[fringe_top:fringe_bottom, fringe_left:fringe_right] == 0] = 0
+        transparency[fringe[fringe_top:fringe_bottom, fringe_left:fringe_right] == 0] = 1
+
+        return ((top - y, left - x, block),
+                (fringe_top - y, fringe_left - x, values, transparency) if fringe_bottom > fringe_top else None)
+
+    def blit(self, image, x, y, caption, color):
+        (top, left, block), fringe = self.sprite(caption, color)
+        if fringe is not None:
+            fringe_top, fringe_left, values, transparency = fringe
+            target, source = _clip(image, fringe_top + y, fringe_left + x, values.shape)
+            if target is not None:
+                region = image[target]
+                region[:] = np.rint(values[source] + region * transparency[source]).astype(image.dtype)
+
+        target, source = _clip(image, top + y, left + x, block.shape)
+        if target is not None:
+            image[target] = block[source]
+
+
+def _extent(mask):
+    # Bounding rows and columns of the set pixels, empty when there are none
+    rows, columns = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if len(rows) == 0:
+        return 0, 0, 0, 0
+    return rows[0], rows[-1] + 1, columns[0], columns[-1] + 1
+
+
+def _clip(image, top, left, shape):
+    # Slices of image and of a patch placed at (top, left), clipped like OpenCV clips what it draws
+    height, width = image.shape[:2]
+    bottom, right = top + shape[0], left + shape[1]
+    if top >= 0 and left >= 0 and bottom <= height and right <= width:
+        return (slice(top, bottom), slice(left, right)), (slice(None), slice(None))
+    if max(top, 0) >= min(bottom, height) or max(left, 0) >= min(right, width):
+        return None, None
+    target = (slice(max(top, 0), min(bottom, height)), slice(max(left, 0), min(right, width)))
+    source = (slice(max(-top, 0), shape[0] - max(bottom - height, 0)), slice(max(-left, 0), shape[1] - max(right - width, 0)))
+    return target, source
+
+
+def corners(boxes):
+    # The four corners of every box, in the shape cv2.polylines takes
+    x1, y1, x2, y2 = np.asarray(boxes, dtype=np.int32).reshape(-1, 4).T
+    return np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                     np.stack([x2, y2], 1), np.stack([x1, y2], 1)], 1)
+
+
+def draw_outlines(image, boxes, box_colors, thickness=1):
+    """
+    Draws the outlines of all boxes with one cv2.polylines call per color instead of one
+    cv2.rectangle per box. The pixels are the same as cv2.rectangle's.
+    """
+    polygons = corners(boxes)
+    box_colors = np.asarray(box_colors).reshape(-1, 3)
+    if len(box_colors) == 1:
+        box_colors = np.repeat(box_colors, len(polygons), axis=0)
+
+    unique_colors, groups = np.unique(box_colors, axis=0, return_inverse=True)
+    for group, color in enumerate(unique_colors.tolist()):
+        cv2.polylines(image, list(polygons[groups.ravel() == group]), True, color, thickness)
+    return image
+
+
+def blend_boxes(image, original, boxes, box_colors, alpha):
+    """
+    Blends the box fills into image in place, like addWeighted of a copy of original with every
+    box filled in order (later boxes on top) over image. Only the extent spanned by the boxes is
+    blended, pixels outside it stay as they are.
+    """
+    height, width = image.shape[:2]
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    x1, y1 = np.clip(boxes[:, 0], 0, width), np.clip(boxes[:, 1], 0, height)
+    x2, y2 = np.clip(boxes[:, 2] + 1, 0, width), np.clip(boxes[:, 3] + 1, 0, height)
+
+    # Thick outlines reach past the boxes, and those pixels are blended with the frame too
+    left, top = max(int(x1.min()) - 2, 0), max(int(y1.min()) - 2, 0)
+    right, bottom = min(int(x2.max()) + 2, width), min(int(y2.max()) + 2, height)
+    if left >= right or top >= bottom:
+        return image
+
+    mask = original[top:bottom, left:right].copy()
+    for (fill_x1, fill_y1, fill_x2, fill_y2), color in zip((boxes - [left, top, left, top]).tolist(),
+                                                           np.asarray(box_colors).tolist()):
+        cv2.rectangle(mask, (fill_x1, fill_y1), (fill_x2, fill_y2), color, -1)
+
+    region = image[top:bottom, left:right]
+    region[:] = cv2.addWeighted(mask, alpha, region, 1 - alpha, 0)
+    return image
+
+
+_detection_sprites = {}
+
+
+def render_detections(image, boxes, scores, class_ids, mask_alpha=0.3, track_ids=None):
+    """
+    Draws like utils.draw_detections from a single copy of the frame: outlines are drawn by
+    draw_outlines, the fills are blended in place over the boxes only and the labels are blitted
+    from a SpriteCache, on top of every box. Where a box overlaps a label the picture differs from
+    draw_detections, which lets later boxes cover earlier labels.
+    """
+    det_img = image.copy()
+
+    img_height, img_width = image.shape[:2]
+    size = min([img_height, img_width]) * 0.0006
+    text_thickness = int(min([img_height, img_width]) * 0.001)
+
+    sprites = _detection_sprites.get((size, text_thickness))
+    if sprites is None:
+        sprites = _detection_sprites[(size, text_thickness)] = SpriteCache(
+            lambda canvas, x1, y1, caption, color, text_color=(255, 255, 255):
+                draw_label(canvas, x1, y1, caption, color, size, text_thickness, text_color),
+            cv2.FONT_HERSHEY_SIMPLEX, size, text_thickness
+        )
+
+    if len(scores) == 0:
+        return det_img
+
+    boxes = np.asarray(boxes).reshape(-1, 4).astype(int)
+    class_ids = np.asarray(class_ids)
+    # OpenCV rounds the float class colors when it draws them
+    box_colors = np.clip(np.rint(colors[class_ids]), 0, 255).astype(np.uint8)
+
+    draw_outlines(det_img, boxes, box_colors, 2)
+    blend_boxes(det_img, image, boxes, box_colors, mask_alpha)
+
+    if track_ids is None:
+        track_ids = [None] * len(scores)
+    for (x1, y1, _, _), score, class_id, track_id, color in zip(boxes.tolist(), scores, class_ids.tolist(),
+                                                              track_ids, box_colors.tolist()):
+        label = class_names[class_id]
+        caption = f'{label} {int(score * 100)}%' if track_id is None else f'{label} #{track_id} {int(score * 100)}%'
+        sprites.blit(det_img, x1, y1, caption, tuple(color))
+
+    return det_img
@@ -0,0 +1,237 @@
+import cv2
+import numpy as np
+
+from .utils import draw_detections, iou_matrix
+
+# Points followed by optical flow across the frame (columns, rows), and the width frames are
+# downscaled to before following them
+flow_grid = (32, 18)
+flow_width = 640
+flow_criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+# Size of the grayscale thumbnails compared to score scene changes
+scene_size = (64, 36)
+
+
+def centers(boxes):
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+
+class IoUTracker:
+    """
+    Gives detections stable ids across frames. Detections are matched greedily to the tracks of
+    the same class by IoU and, for the ones left over, by centroid distance. Between detections the
+    tracks move at the velocity of their centers, or by the offsets given to predict(). Tracks that
+    go unmatched for more than max_age detections are dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=2, min_hits=2):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.next_id = 0
+        self.confirmed = set()
+
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.scores = np.zeros(0, dtype=np.float32)
+        self.class_ids = np.zeros(0, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.anchors = np.zeros((0, 2), dtype=np.float32)
+        self.last_seen = np.zeros(0, dtype=np.int64)
+        self.velocity = np.zeros((0, 2), dtype=np.float32)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+
+    @property
+    def count(self):
+        # Objects seen in at least min_hits detections, counted once however many frames they span
+        return len(self.confirmed)
+
+    def visible(self):
+        # Tracks matched by the latest detection
+        current = self.misses == 0
+        return self.boxes[current], self.scores[current], self.class_ids[current], self.ids[current]
+
+    def predict(self, offsets=None):
+        # Carries every track one frame forward, by its velocity unless per-track offsets are given
+        self.boxes += np.tile(self.velocity if offsets is None else offsets, 2).astype(np.float32)
+
+    def match(self, boxes, class_ids):
+        if len(self.boxes) == 0 or len(boxes) == 0:
+            return []
+
+        track_areas = (self.boxes[:, 2] - self.boxes[:, 0]) * (self.boxes[:, 3] - self.boxes[:, 1])
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ious = np.nan_to_num(iou_matrix(self.boxes, track_areas, boxes, areas))
+        same_class = self.class_ids[:, None] == class_ids[None, :]
+
+        # A box whose IoU fell short can still match when its center stayed within half the track's size
+        distances = np.linalg.norm(centers(self.boxes)[:, None] - centers(boxes)[None, :], axis=2)
+        reach = np.max(self.boxes[:, 2:] - self.boxes[:, :2], axis=1) / 2
+
+        matches = []
+        used_tracks, used_detections = set(), set()
+        for pairs, cost in ((same_class & (ious >= self.iou_threshold), -ious),
+                            (same_class & (distances < reach[:, None]), distances)):
+            tracks, detections = np.nonzero(pairs)
+            for index in np.argsort(cost[tracks, detections], kind="stable"):
+                track, detection = int(tracks[index]), int(detections[index])
+                if track in used_tracks or detection in used_detections:
+                    continue
+                used_tracks.add(track)
+                used_detections.add(detection)
+                matches.append((track, detection))
+        return matches
+
+    def update(self, boxes, scores, class_ids, frame_index):
+        """
+        Matches the detections made on frame_index to the tracks and returns the track id of every
+        detection. Unmatched detections start new tracks.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float32)
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        track_ids = np.zeros(len(boxes), dtype=np.int64)
+
+        matched = np.zeros(len(self.boxes), dtype=bool)
+        unmatched = np.ones(len(boxes), dtype=bool)
+        for track, detection in self.match(boxes, class_ids):
+            center = centers(boxes[detection:detection + 1])[0]
+            self.velocity[track] = (center - self.anchors[track]) / max(frame_index - self.last_seen[track], 1)
+            self.boxes[track] = boxes[detection]
+            self.scores[track] = scores[detection]
+            self.anchors[track] = center
+            self.last_seen[track] = frame_index
+            self.hits[track] += 1
+            matched[track] = True
+            unmatched[detection] = False
+            track_ids[detection] = self.ids[track]
+            if self.hits[track] >= self.min_hits:
+                self.confirmed.add(int(self.ids[track]))
+
+        self.misses[matched] = 0
+        self.misses[~matched] += 1
+        alive = self.misses <= self.max_age
+
+        new = np.flatnonzero(unmatched)
+        new_ids = np.arange(self.next_id, self.next_id + len(new))
+        self.next_id += len(new)
+        track_ids[new] = new_ids
+        if self.min_hits <= 1:
+            self.confirmed.update(new_ids.tolist())
+
+        self.boxes = np.concatenate([self.boxes[alive], boxes[new]])
+        self.scores = np.concatenate([self.scores[alive], scores[new]])
+        self.class_ids = np.concatenate([self.class_ids[alive], class_ids[new]])
+        self.ids = np.concatenate([self.ids[alive], new_ids])
+        self.anchors = np.concatenate([self.anchors[alive], centers(boxes[new])])
+        self.last_seen = np.concatenate([self.last_seen[alive], np.full(len(new), frame_index)])
+        self.velocity = np.concatenate([self.velocity[alive], np.zeros((len(new), 2), dtype=np.float32)])
+        self.hits = np.concatenate([self.hits[alive], np.ones(len(new), dtype=np.int64)])
+        self.misses = np.concatenate([self.misses[alive], np.zeros(len(new), dtype=np.int64)])
+        return track_ids
+
+
+class YOLOv8Tracker:
+    """
+    Tracking mode for a YOLOv8 detector. The detector runs every detect_every frames, or sooner when
+    the scene changes by more than scene_threshold (mean absolute difference of small grayscale
+    thumbnails, 0-1). In between, the boxes of the last detection are carried forward by sparse
+    optical flow, or by their velocity when optical_flow is off, and keep their track ids.
+
+    Calling it returns (boxes, scores, class_ids, track_ids) like the detector plus the ids.
+    """
+
+    def __init__(self, detector, detect_every=5, scene_threshold=0.08, optical_flow=True,
+                 iou_threshold=0.3, max_age=2, min_hits=2):
+        self.detector = detector
+        self.detect_every = detect_every
+        self.scene_threshold = scene_threshold
+        self.optical_flow = optical_flow
+        self.tracker = IoUTracker(iou_threshold, max_age, min_hits)
+
+        self.frame_index = -1
+        self.last_detection = None
+        self.detections = 0
+        self.reference = None
+        self.previous_gray = None
+
+    def __call__(self, image):
+        return self.track(image)
+
+    def scene_change(self, thumbnail):
+        if self.reference is None:
+            return 1.0
+        return float(cv2.absdiff(thumbnail, self.reference).mean()) / 255.0
+
+    def track(self, image):
+        self.frame_index += 1
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, scene_size, interpolation=cv2.INTER_AREA)
+
+        # Tracks always move to this frame first, so fresh detections are matched where they are now
+        self.tracker.predict(self.flow_offsets(gray) if self.optical_flow else None)
+
+        due = self.last_detection is None or self.frame_index - self.last_detection >= self.detect_every
+        if due or self.scene_change(thumbnail) > self.scene_threshold:
+            boxes, scores, class_ids = self.detector(image)
+            track_ids = self.tracker.update(boxes, scores, class_ids, self.frame_index)
+            self.last_detection = self.frame_index
+            self.detections += 1
+            self.reference = thumbnail
+            self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+            self.scores = np.asarray(scores, dtype=np.float32)
+            self.class_ids = np.asarray(class_ids, dtype=np.int64)
+            self.track_ids = track_ids
+        else:
+            self.boxes, self.scores, self.class_ids, self.track_ids = self.tracker.visible()
+
+        self.previous_gray = gray
+        return self.boxes, self.scores, self.class_ids, self.track_ids
+
+    def flow_offsets(self, gray):
+        """
+        Follows a fixed grid of points with Lucas-Kanade on downscaled frames. Each track moves by
+        the mean displacement of the points inside it, or by the median of the whole grid (the
+        camera motion) when no point falls inside it. Without any followed point the tracks keep
+        their velocity.
+        """
+        boxes = self.tracker.boxes
+        offsets = self.tracker.velocity.copy()
+        if len(boxes) == 0 or self.previous_gray is None:
+            return offsets
+
+        scale = min(1.0, flow_width / gray.shape[1])
+        previous = cv2.resize(self.previous_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        current = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        height, width = current.shape[:2]
+        grid_x, grid_y = np.meshgrid((np.arange(flow_grid[0]) + 0.5) * width / flow_grid[0],
+                                     (np.arange(flow_grid[1]) + 0.5) * height / flow_grid[1])
+        points = np.stack([grid_x.ravel(), grid_y.ravel()], axis=1).astype(np.float32).reshape(-1, 1, 2)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(previous, current, points, None, winSize=(15, 15), maxLevel=2,
+                                                    criteria=flow_criteria)
+        followed = status.ravel().astype(bool)
+        if not followed.any():
+            return offsets
+
+        points = points.reshape(-1, 2)[followed] / scale
+        displacement = (moved.reshape(-1, 2)[followed] - points * scale) / scale
+        offsets[:] = np.median(displacement, axis=0)
+
+        inside = ((points[None, :, 0] >= boxes[:, None, 0]) & (points[None, :, 0] <= boxes[:, None, 2]) &
+                  (points[None, :, 1] >= boxes[:, None, 1]) & (points[None, :, 1] <= boxes[:, None, 3]))
+        counts = inside.sum(axis=1)
+        covered = counts > 0
+        offsets[covered] = (inside[covered].astype(np.float32) @ displacement) / counts[covered, None]
+        return offsets
+
+    @property
+    def count(self):
+        return self.tracker.count
+
+    def draw_detections(self, image, draw_scores=True, mask_alpha=0.4):
+
+        return draw_detections(image, self.boxes, self.scores,
+                               self.class_ids, mask_alpha, self.track_ids)